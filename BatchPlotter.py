@@ -0,0 +1,121 @@
+import os
+import time
+import pickle
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor
+
+class DataReference:
+
+    '''
+    Recipe to make a data object inside a worker process instead of sending it
+    e.g. DataReference(THxxData, [("DY", "DY.root")], "mm2016/dilep_pt_mm40to64", "Drell-Yan", "red", cache=cache)
+    the same reference is made only once per worker
+    '''
+    def __init__(self, loader, *args, **kwargs):
+
+        self.loader=loader
+        self.args=args
+        self.kwargs=kwargs
+
+    def get_key(self):
+        return pickle.dumps((self.loader, self.args, sorted(self.kwargs.items())))
+
+    def load(self):
+        return self.loader(*self.args, **self.kwargs)
+
+class PlotSpec:
+
+    '''
+    One output plot
+    out_name: output file name given to MatplotlibDrawer.save_plot()
+    draw_calls: [(method_name, args, kwargs)] of MatplotlibDrawer called in order,
+                axis settings are calls as well, e.g. ("set_log_xscale", (0,), {})
+                data objects in args and kwargs can be given directly or as DataReference
+    drawer_options: keyword arguments of MatplotlibDrawer()
+    save_options: keyword arguments of MatplotlibDrawer.save_plot(), e.g. {"formats": ["pdf", "png"]}
+    '''
+    def __init__(self, out_name, draw_calls, drawer_options=None, save_options=None):
+
+        self.out_name=out_name
+        self.draw_calls=draw_calls
+        self.drawer_options={} if drawer_options is None else drawer_options
+        self.save_options={} if save_options is None else save_options
+
+loaded_data={} # DataReference key: data object, kept for the lifetime of a worker
+
+def resolve_data(argument):
+
+    if not isinstance(argument, DataReference):
+        return argument
+
+    key=argument.get_key()
+    if key not in loaded_data:
+        loaded_data[key]=argument.load()
+    return loaded_data[key]
+
+def init_worker():
+    # non-interactive backend and fixed file dates so outputs are the same on every run
+
+    os.environ.setdefault("SOURCE_DATE_EPOCH", "0")
+
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    matplotlib.rcParams["svg.hashsalt"]="plotter"
+
+def render_plot(plot_spec):
+    # returns {"out_name", "time", "error"}, error is None or the traceback of the failure
+
+    from MatplotlibDrawer import MatplotlibDrawer
+
+    start_time=time.perf_counter()
+    error=None
+    drawer=None
+    try:
+        drawer=MatplotlibDrawer(use_pyplot=False, **plot_spec.drawer_options)
+        for method_name, args, kwargs in plot_spec.draw_calls:
+            args=[resolve_data(argument) for argument in args]
+            kwargs={name: resolve_data(argument) for name, argument in kwargs.items()}
+            getattr(drawer, method_name)(*args, **kwargs)
+        drawer.save_plot(plot_spec.out_name, **plot_spec.save_options)
+    except Exception:
+        error=traceback.format_exc()
+    finally:
+        if drawer is not None:
+            drawer.close()
+
+    return {"out_name": plot_spec.out_name, "time": time.perf_counter()-start_time, "error": error}
+
+def render_plots(plot_specs, n_workers=None):
+    # render PlotSpecs in a process pool, results are in the order of plot_specs
+    # n_workers: None uses all cores, 0 or 1 renders in this process with its current backend
+
+    if n_workers is None:
+        n_workers=os.cpu_count()
+
+    if n_workers <= 1:
+        return [render_plot(plot_spec) for plot_spec in plot_specs]
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker) as executor:
+        return list(executor.map(render_plot, plot_specs))
+
+def print_summary(results):
+
+    total_time=sum(result["time"] for result in results)
+    n_failed=sum(result["error"] is not None for result in results)
+    print("{} plots, {} failed, {:.2f} s rendering".format(len(results), n_failed, total_time))
+    for result in results:
+        if result["error"] is not None:
+            print(result["out_name"])
+            print(result["error"])
+
+if __name__=='__main__':
+
+    from THxxData import THxxData
+
+    dy_hist=DataReference(THxxData, [("DY50plus","/Users/jhkim/cms_snu/ISRAnalyzer_DYJets.root")],
+                          "mm2016/dilep_pt_mm40to64", "Drell-Yan", "red")
+    plot_specs=[PlotSpec("dilep_pt_mm40to64.pdf", [("draw_hist", (dy_hist, 0, "red"), {"label": "Drell-Yan"}),
+                                                    ("set_log_xscale", (0,), {}),
+                                                    ("draw_labels", (0,), {})])]
+    print_summary(render_plots(plot_specs))
@@ -0,0 +1,127 @@
+import numpy as np
+
+from helper import *
+from Profiler import timed
+from NumpyHistData import sum_data
+
+class CompatibilityScan:
+
+    '''
+    Data/MC agreement of many distributions at once, computed on the bin arrays without drawing
+    the bins of all distributions are joined into one array and every test is a segment sum over it
+
+    syst_names: sources used for the covariance test, all sources if None
+    sort_by: column the table is sorted by, smallest first, e.g. "p_total" or "ks_p"
+
+    columns of the table returned by scan():
+        chi2_stat, chi2_total, chi2_covariance: chi2 with data and MC statistical, total (stat+syst) or full covariance errors
+        ndf: bins with a non-zero total error, ndf_stat: bins with a non-zero statistical error, used by chi2_stat
+        p_*: chi2 probabilities
+        max_pull: largest |data-MC|/total error
+        ks_distance, ks_p: largest difference of the normalized cumulative distributions (in bin order for 2D)
+                           and its asymptotic probability with the effective numbers of entries
+
+        scan=CompatibilityScan()
+        table, pulls = scan.scan([("dilep_pt_mm40to64", data_hist, [dy_hist, tt_hist]), ...])
+        for name in table["name"][table["p_total"] < 0.01]:
+            ... draw only these
+    '''
+    def __init__(self, syst_names=None, sort_by="p_total"):
+
+        self.syst_names=syst_names
+        self.sort_by=sort_by
+
+    def get_pair(self, data, mc):
+        # mc: one data object or a list of them to stack
+
+        if isinstance(mc, (list, tuple)):
+            mc=sum_data(mc)
+        if len(data.bin_contents) != len(mc.bin_contents) or len(data.bin_contents) == 0:
+            raise ValueError("Data and MC must have the same non-zero number of bins")
+        return data, mc
+
+    def get_total_variance(self, data, mc):
+        # errors toward each other: data down and MC up where data is above MC
+
+        above=data.bin_contents > mc.bin_contents
+        data_error=np.where(above, data.get_total_errors(up_down.down), data.get_total_errors(up_down.up))
+        mc_error=np.where(above, mc.get_total_errors(up_down.up), mc.get_total_errors(up_down.down))
+        return np.square(data_error)+np.square(mc_error)
+
+    def get_covariance_chi2(self, data, mc, in_test):
+
+        covariance=data.get_covariance(self.syst_names, include_stat=True)+mc.get_covariance(self.syst_names, include_stat=True)
+        residual=(data.bin_contents-mc.bin_contents)[in_test]
+        covariance=covariance[np.ix_(in_test, in_test)]
+        return residual @ np.linalg.pinv(covariance, hermitian=True) @ residual
+
+    @timed("CompatibilityScan.scan")
+    def scan(self, pairs):
+        # pairs: (name, data, mc) of each distribution
+        # returns (structured array with one row per distribution, {name: per-bin pulls with the total errors})
+
+        names=[]
+        data_mc=[]
+        for name, data, mc in pairs:
+            names.append(name)
+            data_mc.append(self.get_pair(data, mc))
+
+        n_bins=np.array([len(data.bin_contents) for data, mc in data_mc])
+        starts=np.concatenate([[0], np.cumsum(n_bins)[:-1]])
+
+        data_contents=np.concatenate([data.bin_contents for data, mc in data_mc])
+        mc_contents=np.concatenate([mc.bin_contents for data, mc in data_mc])
+        data_sumw2=np.concatenate([data.bin_sumw2 for data, mc in data_mc])
+        mc_sumw2=np.concatenate([mc.bin_sumw2 for data, mc in data_mc])
+        stat_variance=data_sumw2+mc_sumw2
+        total_variance=np.concatenate([self.get_total_variance(data, mc) for data, mc in data_mc])
+
+        # bins without an error are left out of the tests using it
+        in_stat_test=stat_variance > 0
+        in_test=total_variance > 0
+        residual=data_contents-mc_contents
+        pulls=divide_arrays(residual, np.sqrt(total_variance))
+
+        table=np.zeros(len(names), dtype=[("name", "U"+str(max([len(name) for name in names]+[1]))), ("n_bins", "i8"), ("ndf", "i8"), ("ndf_stat", "i8"),
+                                          ("chi2_stat", "f8"), ("chi2_total", "f8"), ("chi2_covariance", "f8"),
+                                          ("p_stat", "f8"), ("p_total", "f8"), ("p_covariance", "f8"),
+                                          ("max_pull", "f8"), ("ks_distance", "f8"), ("ks_p", "f8")])
+        table["name"]=names
+        table["n_bins"]=n_bins
+        table["ndf"]=np.add.reduceat(in_test.astype(np.int64), starts)
+        table["ndf_stat"]=np.add.reduceat(in_stat_test.astype(np.int64), starts)
+        table["chi2_stat"]=np.add.reduceat(divide_arrays(np.square(residual), stat_variance), starts)
+        table["chi2_total"]=np.add.reduceat(np.square(pulls), starts)
+        table["chi2_covariance"]=[self.get_covariance_chi2(data, mc, in_test[start:start+n])
+                                  for (data, mc), start, n in zip(data_mc, starts, n_bins)]
+        table["max_pull"]=np.maximum.reduceat(np.abs(pulls), starts)
+
+        # normalized cumulative distributions of each segment
+        data_sums=np.add.reduceat(data_contents, starts)
+        mc_sums=np.add.reduceat(mc_contents, starts)
+        data_cumulative=divide_arrays(np.cumsum(data_contents)-np.repeat(np.cumsum(data_contents)[starts]-data_contents[starts], n_bins),
+                                      np.repeat(data_sums, n_bins))
+        mc_cumulative=divide_arrays(np.cumsum(mc_contents)-np.repeat(np.cumsum(mc_contents)[starts]-mc_contents[starts], n_bins),
+                                    np.repeat(mc_sums, n_bins))
+        table["ks_distance"]=np.maximum.reduceat(np.abs(data_cumulative-mc_cumulative), starts)
+
+        for chi2_column, ndf_column, p_column in (("chi2_stat", "ndf_stat", "p_stat"), ("chi2_total", "ndf", "p_total"),
+                                                 ("chi2_covariance", "ndf", "p_covariance")):
+            table[p_column]=[get_chi2_probability(chi2, ndf) for chi2, ndf in zip(table[chi2_column], table[ndf_column])]
+        data_entries=divide_arrays(np.square(data_sums), np.add.reduceat(data_sumw2, starts))
+        mc_entries=divide_arrays(np.square(mc_sums), np.add.reduceat(mc_sumw2, starts))
+        n_entries=divide_arrays(data_entries*mc_entries, data_entries+mc_entries)
+        table["ks_p"]=get_kolmogorov_probability(np.sqrt(n_entries)*table["ks_distance"])
+
+        table=np.sort(table, order=self.sort_by)
+        pulls={name: pulls[start:start+n] for name, start, n in zip(names, starts, n_bins)}
+        return table, pulls
+
+    def print_table(self, table, n_rows=None):
+
+        print("{:<40} {:>5} {:>12} {:>10} {:>10} {:>10} {:>9} {:>8} {:>10}".format(
+              "name", "ndf", "chi2_stat", "chi2_tot", "chi2_cov", "p_total", "max_pull", "ks_d", "ks_p"))
+        for row in table[:n_rows]:
+            print("{:<40} {:>5} {:>12.3f} {:>10.3f} {:>10.3f} {:>10.3g} {:>9.3f} {:>8.4f} {:>10.3g}".format(
+                  row["name"], row["ndf"], row["chi2_stat"], row["chi2_total"], row["chi2_covariance"],
+                  row["p_total"], row["max_pull"], row["ks_distance"], row["ks_p"]))
@@ -0,0 +1,187 @@
+import numpy as np
+
+from helper import *
+from HistogramCatalog import HistogramCatalog
+from NumpyHistData import NumpyHistData
+from VariationStore import VariationStore
+
+class HistAccumulator:
+
+    '''
+    Sum of one histogram over inputs added one at a time, e.g. outputs of grid jobs
+    only the running sums are kept, memory does not grow with the number of inputs
+
+    syst_names, syst_rules: as THxxDataWithSyst, variations are read from the same files as the central histogram
+    keep_samples: also keep the sum of each sample, input_sample_arrays of the finished object
+    unrolled_axes: see THxxData
+
+    accumulators of the same histogram filled in separate processes can be merged, see accumulate_files()
+    '''
+    def __init__(self, hist_name, hist_label_name="", color="black", syst_names=None, syst_rules=None, keep_samples=False, unrolled_axes=None):
+
+        self.hist_name=hist_name
+        self.hist_label_name=hist_label_name
+        self.color=color
+        self.syst_names=syst_names
+        self.syst_rules=syst_rules
+        self.keep_samples=keep_samples
+
+        self.axis_edges=None
+        if unrolled_axes is not None:
+            self.axis_edges=get_unrolled_axis_edges(unrolled_axes)
+
+        self.n_inputs=0
+        self.sample_names=[]
+        self.sample_arrays={} # sample_name: [bin_contents, bin_sumw2], only if keep_samples
+
+        # set by the first input
+        self.bin_edges=None
+        self.bin_contents=None
+        self.bin_sumw2=None
+        self.variations=None
+        self.fill_stats=np.zeros(4) # statistics of the fills of 1D inputs, None once an input without them is added
+
+    def check_binning(self, bin_edges):
+
+        if self.bin_edges is None:
+            self.bin_edges=np.array(bin_edges, dtype=np.float64)
+            self.bin_contents=np.zeros(len(self.bin_edges)-1)
+            self.bin_sumw2=np.zeros(len(self.bin_edges)-1)
+            if self.syst_names is not None:
+                self.variations=VariationStore(self.syst_names, len(self.bin_contents), self.syst_rules)
+        elif not np.array_equal(self.bin_edges, bin_edges):
+            raise ValueError("Binning of " + self.hist_name + " differs between inputs")
+
+    def add_sample_arrays(self, sample_name, bin_contents, bin_sumw2):
+
+        if sample_name not in self.sample_names:
+            self.sample_names.append(sample_name)
+        if not self.keep_samples:
+            return
+
+        if sample_name not in self.sample_arrays:
+            self.sample_arrays[sample_name]=[np.zeros_like(self.bin_contents), np.zeros_like(self.bin_sumw2)]
+        self.sample_arrays[sample_name][0]+=bin_contents
+        self.sample_arrays[sample_name][1]+=bin_sumw2
+
+    def add_arrays(self, sample_name, bin_edges, bin_contents, bin_sumw2, fill_stats=None):
+
+        self.check_binning(bin_edges)
+        self.bin_contents+=bin_contents
+        self.bin_sumw2+=bin_sumw2
+        self.fill_stats=None if self.fill_stats is None or fill_stats is None else self.fill_stats+fill_stats
+        self.add_sample_arrays(sample_name, bin_contents, bin_sumw2)
+        self.n_inputs+=1
+
+    def add_hist(self, sample_name, thist):
+
+        fill_stats=None
+        if thist.GetDimension() > 1:
+            if self.axis_edges is None:
+                self.axis_edges=get_axis_edges(thist)
+        else:
+            stats=np.zeros(13) # TH1::kNstat
+            thist.GetStats(stats)
+            fill_stats=stats[:4]
+        self.add_arrays(sample_name, *get_hist_arrays(thist), fill_stats=fill_stats)
+
+    def add_syst_hist(self, syst_name, index, thist):
+        # variation index of syst_name, add_hist() of the same input must be called first
+
+        bin_edges, bin_contents, bin_sumw2 = get_hist_arrays(thist)
+        self.check_binning(bin_edges)
+        self.variations.add_raw(syst_name, index, bin_contents)
+
+    def add_file(self, root_file, sample_name=None):
+        # read the histogram and its variations from one file and close it
+        # files without the histogram are skipped, returns False for them
+
+        if sample_name is None:
+            sample_name=root_file
+
+        with HistogramCatalog([(sample_name, root_file)]) as catalog:
+            if self.syst_names is not None:
+                catalog.index_keys(root_file) # missing variations are not looked up one by one
+
+            temp_thist=catalog.get_hist(root_file, self.hist_name)
+            if temp_thist is None:
+                return False
+            self.add_hist(sample_name, temp_thist)
+
+            if self.syst_names is not None:
+                # if systematic hist not exist add nominal one
+                for syst_name in self.syst_names:
+                    for index, syst_postfix in enumerate(self.syst_names[syst_name]):
+                        self.add_syst_hist(syst_name, index, catalog.get_syst_hist(root_file, self.hist_name, syst_name, syst_postfix))
+
+        return True
+
+    def merge(self, other):
+        # add the sums of another accumulator of the same histogram, returns self
+
+        if other.bin_edges is None:
+            return self
+
+        self.check_binning(other.bin_edges)
+        if self.axis_edges is None:
+            self.axis_edges=other.axis_edges
+
+        self.bin_contents+=other.bin_contents
+        self.bin_sumw2+=other.bin_sumw2
+        self.fill_stats=None if self.fill_stats is None or other.fill_stats is None else self.fill_stats+other.fill_stats
+        if self.variations is not None:
+            self.variations.raw_array+=other.variations.raw_array
+
+        for sample_name in other.sample_names:
+            if sample_name in other.sample_arrays:
+                self.add_sample_arrays(sample_name, *other.sample_arrays[sample_name])
+            elif sample_name not in self.sample_names:
+                self.sample_names.append(sample_name)
+        self.n_inputs+=other.n_inputs
+
+        return self
+
+    def finish(self):
+        # NumpyHistData of the sums, more inputs can still be added to the accumulator afterwards
+
+        if self.bin_edges is None:
+            raise ValueError("No input with " + self.hist_name + " was added")
+
+        variations=None
+        if self.variations is not None:
+            variations=self.variations.with_raw_array(self.variations.raw_array.copy())
+        input_sample_arrays=[(sample_name, self.sample_arrays[sample_name][0].copy(), self.sample_arrays[sample_name][1].copy())
+                             for sample_name in self.sample_names if sample_name in self.sample_arrays]
+
+        return NumpyHistData(self.bin_edges.copy(), self.bin_contents.copy(), self.bin_sumw2.copy(),
+                             hist_label_name=self.hist_label_name, color=self.color, hist_name=self.hist_name,
+                             sample_names=self.sample_names, input_sample_arrays=input_sample_arrays,
+                             variations=variations, axis_edges=self.axis_edges,
+                             fill_stats=None if self.fill_stats is None or self.axis_edges is not None else self.fill_stats.copy())
+
+def accumulate_files(input_root_files, *args, **kwargs):
+    # HistAccumulator(*args, **kwargs) filled from [(sample_name, root_file)]
+    # to run in worker processes, the returned accumulators are merged in the parent
+
+    accumulator=HistAccumulator(*args, **kwargs)
+    for sample_name, root_file in input_root_files:
+        accumulator.add_file(root_file, sample_name)
+    return accumulator
+
+if __name__=='__main__':
+
+    import glob
+    from functools import partial, reduce
+    from concurrent.futures import ProcessPoolExecutor
+
+    job_files=[("DY", root_file) for root_file in sorted(glob.glob("/Users/jhkim/cms_snu/DYJets_jobs/*.root"))]
+    syst_names={"_scale":["_up","_down"], "_IDSF":["_up","_down"]}
+
+    # one accumulator per chunk of job outputs, merged at the end
+    chunks=[job_files[index::4] for index in range(4)]
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        accumulators=list(executor.map(partial(accumulate_files, hist_name="mm2016/dilep_pt_mm40to64", hist_label_name="Drell-Yan",
+                                               color="red", syst_names=syst_names, keep_samples=True), chunks))
+    dy_hist=reduce(HistAccumulator.merge, accumulators).finish()
+
+    print(dy_hist.get_bin_contents(), dy_hist.get_total_errors())
@@ -0,0 +1,108 @@
+import numpy as np
+import os
+import json
+import hashlib
+
+from Profiler import timed
+
+cache_format=2 # part of every key, changed when the cached arrays change
+
+class HistogramCache:
+
+    '''
+    On-disk cache of merged bin arrays, one .npz file per entry
+    entries are keyed by the input file paths, their modification times and the requested names,
+    so a modified input file is read again from ROOT
+    max_bytes: least recently used entries are removed when the directory grows above it
+    '''
+    def __init__(self, cache_dir, max_bytes=1<<30):
+
+        self.cache_dir=cache_dir
+        self.max_bytes=max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, input_root_files, names):
+        # input_root_files: [(sample_name, root_file)], return None if a file can not be checked
+
+        key_items=[]
+        for sample_name, root_file in input_root_files:
+            if "://" in root_file:
+                return None # remote file, modification time not available
+            try:
+                root_file_stat=os.stat(root_file)
+            except OSError:
+                return None
+            key_items.append([sample_name, os.path.abspath(root_file), root_file_stat.st_mtime_ns, root_file_stat.st_size])
+        key_items.append(names)
+        key_items.append(cache_format)
+
+        return hashlib.sha1(json.dumps(key_items).encode()).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key+".npz")
+
+    @timed("HistogramCache.load")
+    def load(self, key):
+        # dictionary of arrays, None if not cached
+
+        path=self.get_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz_file:
+                arrays={name: npz_file[name] for name in npz_file.files}
+        except (OSError, ValueError):
+            return None
+
+        # modification time of an entry is its last use, see evict()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return arrays
+
+    @timed("HistogramCache.save")
+    def save(self, key, arrays):
+
+        path=self.get_path(key)
+        temp_path=path+".tmp"+str(os.getpid())
+        with open(temp_path, "wb") as npz_file:
+            np.savez(npz_file, **arrays)
+        os.replace(temp_path, path) # other jobs never see a partially written entry
+
+        self.evict()
+
+    def get_entries(self):
+        # (last use, size, path) of every entry
+
+        entries=[]
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".npz"):
+                continue
+            path=os.path.join(self.cache_dir, file_name)
+            try:
+                file_stat=os.stat(path)
+            except OSError:
+                continue # removed by another job
+            entries.append((file_stat.st_mtime, file_stat.st_size, path))
+        return entries
+
+    def get_size(self):
+        return sum(size for last_use, size, path in self.get_entries())
+
+    def evict(self):
+        # remove least recently used entries until the cache fits in max_bytes
+
+        entries=sorted(self.get_entries())
+        total_bytes=sum(size for last_use, size, path in entries)
+        for last_use, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes-=size
+
+    def clear(self):
+
+        for last_use, size, path in self.get_entries():
+            os.remove(path)
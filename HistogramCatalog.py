@@ -0,0 +1,229 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from helper import *
+from Profiler import stage, timed, add_bytes_read
+
+class HistogramCatalog:
+
+    '''
+    Open a set of ROOT files once and serve histograms from them
+    input: list of (sample_name, root_file) or list of root_file
+
+    The same catalog can be passed to THxxData and THxxDataWithSyst
+    in place of the file list, histograms are read from each file only once
+    and kept detached from the file, callers must clone before modifying them.
+    THxxData and THxxDataWithSyst release() the histograms of their hist_name once read,
+    so a catalog shared by many observables does not keep them all.
+
+    To read many observables in parallel load them all at once before making the data objects,
+    the process pool is started once per catalog and kept until close():
+        catalog.load(hist_names, syst_names, n_workers=8)
+        hists=[THxxDataWithSyst(catalog, hist_name, ...) for hist_name in hist_names]
+    '''
+    def __init__(self, input_root_files):
+
+        self.input_root_files=[] # (sample_name, root_file)
+        for input_root_file in input_root_files:
+            if isinstance(input_root_file, str):
+                self.input_root_files.append((input_root_file, input_root_file))
+            else:
+                sample_name, root_file = input_root_file
+                self.input_root_files.append((sample_name, root_file))
+
+        self.root_files={} # root_file: opened TFile
+        self.keys={} # root_file: set of histogram names in the file
+        self.hists={} # (root_file, hist_name): histogram or None if not found
+        self.executor=None # process pool of load(), reused by later calls
+        self.n_workers=0
+
+    def get_root_file(self, root_file):
+
+        rt = import_root()
+
+        if root_file not in self.root_files:
+            with stage("TFile.Open"):
+                self.root_files[root_file]=rt.TFile.Open(root_file, "READ")
+            add_bytes_read("TFile.Open", self.root_files[root_file])
+        return self.root_files[root_file]
+
+    @timed("HistogramCatalog.index_keys")
+    def index_keys(self, root_file):
+        # collect full path of every object in the file, directories are walked recursively
+
+        rt = import_root()
+
+        if root_file in self.keys:
+            return self.keys[root_file]
+
+        names=set()
+        directories=[("", self.get_root_file(root_file))]
+        while directories:
+            path, directory = directories.pop()
+            for key in directory.GetListOfKeys():
+                name = path + key.GetName()
+                if rt.TClass.GetClass(key.GetClassName()).InheritsFrom("TDirectory"):
+                    directories.append((name + "/", directory.Get(key.GetName())))
+                else:
+                    names.add(name)
+
+        self.keys[root_file]=names
+        return names
+
+    def has_hist(self, root_file, hist_name):
+
+        if (root_file, hist_name) in self.hists:
+            return self.hists[(root_file, hist_name)] is not None
+        return hist_name in self.index_keys(root_file)
+
+    def get_hist(self, root_file, hist_name):
+        # return None if the histogram does not exist in root_file
+
+        if (root_file, hist_name) not in self.hists:
+            temp_thist=None
+            # skip Get() for names already known to be missing
+            if root_file not in self.keys or hist_name in self.keys[root_file]:
+                temp_root_file=self.get_root_file(root_file)
+                with stage("TFile.Get", temp_root_file):
+                    temp_thist=temp_root_file.Get(hist_name)
+            if is_supported_hist(temp_thist) : # check if histogram exist
+                if temp_thist.GetSumw2N() == 0:
+                    temp_thist.Sumw2()
+                temp_thist.SetDirectory(0)
+            else:
+                temp_thist=None
+            self.hists[(root_file, hist_name)]=temp_thist
+
+        return self.hists[(root_file, hist_name)]
+
+    def get_syst_hist(self, root_file, hist_name, syst_name, syst_postfix):
+        # if systematic hist not exist return nominal one
+
+        temp_thist=self.get_hist(root_file, hist_name+syst_name+syst_postfix)
+        if temp_thist is None:
+            temp_thist=self.get_hist(root_file, hist_name)
+        return temp_thist
+
+    def get_sample_hists(self, hist_name):
+        # (sample_name, histogram) in file order, histogram is None if not found
+
+        return [(sample_name, self.get_hist(root_file, hist_name)) for sample_name, root_file in self.input_root_files]
+
+    def get_names(self, hist_names, syst_names=None):
+        # names of the histograms and all their variations
+
+        if isinstance(hist_names, str):
+            hist_names=[hist_names]
+
+        names=[]
+        for hist_name in hist_names:
+            names.append(hist_name)
+            if syst_names is not None:
+                for syst_name in syst_names:
+                    for syst_postfix in syst_names[syst_name]:
+                        names.append(hist_name+syst_name+syst_postfix)
+        return names
+
+    def release(self, hist_names, syst_names=None):
+        # forget histograms already read, files and key indexes are kept so they can be read again
+
+        for name in self.get_names(hist_names, syst_names):
+            for sample_name, root_file in self.input_root_files:
+                self.hists.pop((root_file, name), None)
+
+    @timed("HistogramCatalog.load")
+    def load(self, hist_names, syst_names=None, n_workers=0):
+        # read all requested histograms with one pass over each file
+        # syst_names: {syst_name: [postfix, ...]} as used in THxxDataWithSyst
+        # n_workers > 1 reads the files in a process pool, see read_hist_dumps()
+
+        names=self.get_names(hist_names, syst_names)
+        root_files=[root_file for sample_name, root_file in self.input_root_files]
+        # only send files with histograms not read yet
+        if n_workers > 1:
+            root_files=[root_file for root_file in root_files
+                        if any((root_file, name) not in self.hists for name in names)]
+        if n_workers > 1 and root_files:
+            executor=self.get_executor(n_workers)
+            # map() keeps the file order, results do not depend on which worker finishes first
+            for root_file, hist_dumps in zip(root_files, executor.map(read_hist_dumps, root_files, repeat(names))):
+                for name, hist_dump in hist_dumps.items():
+                    if (root_file, name) not in self.hists:
+                        self.hists[(root_file, name)]=None if hist_dump is None else make_hist_from_dump(hist_dump)
+        else:
+            for root_file in root_files:
+                self.index_keys(root_file)
+                for name in names:
+                    self.get_hist(root_file, name)
+
+    def get_executor(self, n_workers):
+        # workers start once, ROOT is imported in each of them only once
+
+        if self.executor is not None and self.n_workers != n_workers:
+            self.shutdown_executor()
+        if self.executor is None:
+            self.executor=ProcessPoolExecutor(max_workers=n_workers)
+            self.n_workers=n_workers
+        return self.executor
+
+    def shutdown_executor(self):
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor=None
+            self.n_workers=0
+
+    def close(self):
+        # close files and stop the workers, histograms already read stay available
+
+        for root_file in self.root_files.values():
+            root_file.Close()
+        self.root_files.clear()
+        self.shutdown_executor()
+
+    def clear(self):
+
+        self.close()
+        self.keys.clear()
+        self.hists.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.clear()
+
+def read_hist_dumps(root_file, hist_names):
+    # runs in a worker process, histograms are sent back as plain arrays
+
+    rt = import_root()
+
+    temp_file=rt.TFile.Open(root_file, "READ")
+    hist_dumps={}
+    for hist_name in hist_names:
+        temp_thist=temp_file.Get(hist_name)
+        if is_supported_hist(temp_thist) : # check if histogram exist
+            if temp_thist.GetSumw2N() == 0:
+                temp_thist.Sumw2()
+            hist_dumps[hist_name]=dump_hist(temp_thist)
+        else:
+            hist_dumps[hist_name]=None
+    temp_file.Close()
+
+    return hist_dumps
+
+def get_catalog(input_root_files):
+    # return (catalog, temporary), temporary catalogs should be cleared by the caller
+
+    if isinstance(input_root_files, HistogramCatalog):
+        return input_root_files, False
+    return HistogramCatalog(input_root_files), True
+
+if __name__=='__main__':
+
+    catalog=HistogramCatalog([("DY50plus","/Users/jhkim/cms_snu/ISRAnalyzer_DYJets.root"),
+                              ("DY10to50","/Users/jhkim/cms_snu/ISRAnalyzer_DYJets10to50_MG.root")])
+    catalog.load(["mm2016/dilep_pt_mm40to64", "mm2016/dilep_pt_mm64to81"])
+
+    for sample_name, temp_thist in catalog.get_sample_hists("mm2016/dilep_pt_mm40to64"):
+        print(sample_name, temp_thist)
@@ -1,34 +1,48 @@
-import ROOT as rt
 import numpy as np
 import math
+import os
 import THxxData
 import THxxDataWithSyst
 import copy
 import matplotlib.pyplot as plt
-from matplotlib.collections import PatchCollection
-from matplotlib.patches import Rectangle
+from matplotlib.figure import Figure
 from matplotlib.ticker import MaxNLocator
 from matplotlib.ticker import (MultipleLocator, FormatStrFormatter, AutoMinorLocator, LogLocator, NullFormatter, LogFormatter)
 import matplotlib.patches as mpatches
 import matplotlib.lines as mlines
 
 from helper import *
+from Profiler import timed
 
 import matplotlib as mpl
 mpl.rcParams['hatch.linewidth'] = 0.5
 
 class MatplotlibDrawer:
 
-    def __init__(self, n_row=2, n_col=1, fig_size=(8,7), height_ratios=[1,0.3]):
+    '''
+    use_pyplot: False makes a Figure not registered in pyplot, it is freed with the drawer
+    rasterize_min_bins: data with at least this many bins is drawn as an image inside vector outputs,
+                        axes and text stay vector, None never rasterizes
+    
+    to make many plots with the same layout, keep one drawer and call clear_artists()
+    after each save_plot(), call close() or use "with MatplotlibDrawer() as drawer:" at the end
+    '''
+    def __init__(self, n_row=2, n_col=1, fig_size=(8,7), height_ratios=[1,0.3], use_pyplot=True, rasterize_min_bins=None):
         
         self.n_row = n_row
         self.n_col = n_col
+        self.use_pyplot = use_pyplot
+        self.rasterize_min_bins = rasterize_min_bins
+        if self.use_pyplot :
+            self.fig = plt.figure(figsize=fig_size)
+        else :
+            self.fig = Figure(figsize=fig_size)
         if self.n_row > 1 :
-            self.fig, axes = plt.subplots(self.n_row, self.n_col, sharex=False, figsize=fig_size, gridspec_kw = {'height_ratios':height_ratios})
+            axes = self.fig.subplots(self.n_row, self.n_col, sharex=False, gridspec_kw = {'height_ratios':height_ratios})
         else :
-            self.fig, axes = plt.subplots(self.n_row, self.n_col, sharex=False, figsize=fig_size)
-        plt.tight_layout()
-        plt.subplots_adjust(left=0.15, right=0.9, bottom=0.1, top=0.9, hspace=0.0)
+            axes = self.fig.subplots(self.n_row, self.n_col, sharex=False)
+        self.fig.tight_layout()
+        self.fig.subplots_adjust(left=0.15, right=0.9, bottom=0.1, top=0.9, hspace=0.0)
         
         self.axes = []
         self.labels_in_axes = []
@@ -59,6 +73,40 @@ class MatplotlibDrawer:
         self.labels_in_axes[i_row].clear()
         self.hists_in_axes[i_row].clear()
 
+    def clear_artists(self, i_row=None):
+        # remove drawn data, text and legend but keep layout, scales, ticks and axis titles
+        # i_row=None clears all rows
+
+        rows = range(len(self.axes)) if i_row is None else [i_row]
+        for row in rows:
+            axe = self.axes[row]
+            for container in list(axe.containers):
+                container.remove()
+            for artist in list(axe.lines) + list(axe.collections) + list(axe.patches) + list(axe.texts):
+                artist.remove()
+            if axe.get_legend() is not None:
+                axe.get_legend().remove()
+
+            # forget the data limits of removed artists, fixed ranges are kept
+            axe.relim()
+            axe.autoscale_view()
+
+            self.labels_in_axes[row].clear()
+            self.hists_in_axes[row].clear()
+
+    def close(self):
+        # release the figure, the drawer can not be used after this
+
+        self.fig.clear()
+        if self.use_pyplot:
+            plt.close(self.fig)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def set_log_xscale(self, i_row):
         self.axes[i_row].set_xscale("log")
 
@@ -73,8 +121,22 @@ class MatplotlibDrawer:
     def remove_first_tick_yaxis(self, i_row, prune='lower'):
         self.axes[i_row].yaxis.set_major_locator(MaxNLocator(prune=prune))
 
-    def save_plot(self, out_name = "test"):
-        self.fig.savefig(out_name, format="pdf", dpi=300)
+    def is_rasterized(self, thxxdata):
+        return self.rasterize_min_bins is not None and len(thxxdata.get_bin_contents()) >= self.rasterize_min_bins
+
+    @timed("MatplotlibDrawer.save_plot")
+    def save_plot(self, out_name = "test", formats = None, dpi = 300):
+        # formats: None writes out_name as PDF,
+        # otherwise one file per format named out_name with the extension replaced, e.g. ["pdf", "png"]
+        # see PlotSink to collect many plots in one PDF
+
+        if formats is None:
+            self.fig.savefig(out_name, format="pdf", dpi=dpi)
+            return
+
+        out_name_base = os.path.splitext(out_name)[0]
+        for out_format in formats:
+            self.fig.savefig(out_name_base + "." + out_format, format=out_format, dpi=dpi)
         
     def set_y_range(self, i_row, y_min, y_max):
         self.axes[i_row].set_ylim(y_min, y_max)
@@ -91,75 +153,59 @@ class MatplotlibDrawer:
     def write_text(self, i_row, x, y, text, ha = "left") :
         self.axes[i_row].text(x, y, text, fontsize='xx-large', transform=self.axes[i_row].transAxes, ha = ha)
         
-    # https://matplotlib.org/3.5.0/gallery/statistics/errorbars_and_boxes.html
-    def draw_hatch_error(self, thxxdata, i_row, edgecolor='none', hatch_style='\\\\\\', alpha=0.5):
-        
-        x_bin_centers = thxxdata.get_bin_centers()
-        x_bin_width = thxxdata.get_bin_widths()
-        bin_contents = thxxdata.get_bin_contents()
-        # TODO add option to select specific systematic source
-        total_error = thxxdata.get_stat_errors()
-        
-        xerror = np.array([x_bin_width/2., x_bin_width/2.])
-        yerror = np.array([total_error, total_error])
-                     
-        # Loop over data points; create box from errors at each point
-        errorboxes = [Rectangle((x - xe[0], y - ye[0]), xe.sum(), ye.sum(), fill=False, facecolor=None,
-                        edgecolor=edgecolor, hatch=hatch_style)
-                        for x, y, xe, ye in zip(x_bin_centers, bin_contents, xerror.T, yerror.T)]
+    def get_errors(self, thxxdata, error_name="stat", variation_direction=up_down.up):
+        # error_name: "stat", the name of a systematic source, anything else means total errors
 
-        # Create patch collection with specified colour/alpha
-        pc = PatchCollection(errorboxes, match_original=True, hatch=hatch_style, linewidth=0)
-
-        # Add collection to axes
-        self.axes[i_row].add_collection(pc)
-        
-    def draw_box_error(self, thxxdata, i_row, face_color='red', edge_color='none', alpha=0.1, error_name="stat", label=""):
-        
-        x_bin_centers = thxxdata.get_bin_centers()
-        x_bin_width = thxxdata.get_bin_widths()
-        bin_contents = thxxdata.get_bin_contents()
         if error_name=="stat" :
-            total_error = thxxdata.get_stat_errors()
-        else :
-            total_error = thxxdata.get_total_errors()
-        
-        xerror = np.array([x_bin_width/2., x_bin_width/2.])
-        yerror = np.array([total_error, total_error])
-                     
-        # Loop over data points; create box from errors at each point
-        errorboxes = [Rectangle((x - xe[0], y - ye[0]), xe.sum(), ye.sum())
-                        for x, y, xe, ye in zip(x_bin_centers, bin_contents, xerror.T, yerror.T)]
+            return thxxdata.get_stat_errors(variation_direction)
+        if thxxdata.variations is not None and error_name in thxxdata.variations.source_index :
+            return thxxdata.get_syst_errors(error_name)
+        return thxxdata.get_total_errors(variation_direction)
 
-        # Create patch collection with specified colour/alpha
-        pc = PatchCollection(errorboxes, facecolor=face_color, alpha=alpha,
-                             edgecolor=edge_color, linewidth=0.05)
+    @timed("MatplotlibDrawer.draw_error_band")
+    def draw_error_band(self, thxxdata, i_row, error_name="stat", face_color='none', edge_color='none', alpha=1., hatch=None, linewidth=0., label=""):
+        # contents +- errors drawn as one stair shaped fill, the cost does not grow with the number of bins
 
-        # Add collection to axes
-        self.axes[i_row].add_collection(pc)
+        bin_contents = thxxdata.get_bin_contents()
+        band_lower = bin_contents - self.get_errors(thxxdata, error_name, up_down.down)
+        band_upper = bin_contents + self.get_errors(thxxdata, error_name, up_down.up)
+
+        band = self.axes[i_row].stairs(band_upper, thxxdata.get_bin_edges(), baseline=band_lower, fill=True,
+                                       facecolor=face_color, edgecolor=edge_color, alpha=alpha, hatch=hatch, linewidth=linewidth,
+                                       rasterized=self.is_rasterized(thxxdata))
 
         if label != "" :
-            patch=mpatches.Patch(facecolor=face_color, alpha=alpha, edgecolor=edge_color, linewidth=0.05, label=label)
+            patch=mpatches.Patch(facecolor=face_color, alpha=alpha, edgecolor=edge_color, hatch=hatch, linewidth=linewidth, label=label)
             self.hists_in_axes[i_row].append(patch)
             self.labels_in_axes[i_row].append(label)
+
+        return band
+
+    def draw_hatch_error(self, thxxdata, i_row, edgecolor='none', hatch_style='\\\\\\', alpha=0.5, error_name="stat"):
+        self.draw_error_band(thxxdata, i_row, error_name=error_name, edge_color=edgecolor, alpha=alpha, hatch=hatch_style)
+        
+    def draw_box_error(self, thxxdata, i_row, face_color='red', edge_color='none', alpha=0.1, error_name="stat", label=""):
+        self.draw_error_band(thxxdata, i_row, error_name=error_name, face_color=face_color, edge_color=edge_color,
+                             alpha=alpha, linewidth=0.05, label=label)
     
+    @timed("MatplotlibDrawer.draw_hist")
     def draw_hist(self, thxxdata, i_row, color, label = "", normalisation = 1., set_labels=True):
 
         if i_row >= self.n_row:
             print("Check number of row.")
             return
         
-        x_bin_centers = thxxdata.get_bin_centers()
         x_bin_edges = thxxdata.get_bin_edges()
         bin_contents = thxxdata.get_bin_contents()
-        stat_unc = thxxdata.get_stat_errors()
         
-        self.axes[i_row].hist(x_bin_centers, bins = x_bin_edges, weights=bin_contents, color=color, histtype = "step")
+        # one step outline closed to zero at both ends, as hist(histtype="step") draws it
+        self.axes[i_row].stairs(bin_contents, x_bin_edges, baseline=0, color=color, rasterized=self.is_rasterized(thxxdata))
         if set_labels:
             legend_handle = mlines.Line2D([], [], color=color, label=label)
             self.hists_in_axes[i_row].append(legend_handle)
             self.labels_in_axes[i_row].append(label)
 
+    @timed("MatplotlibDrawer.draw_errorbar")
     def draw_errorbar(self, thxxdata, i_row, fmt = 'o', normalisation = 1., set_labels=True, ms = 4., **kwargs):
         
         if i_row >= self.n_row:
@@ -171,27 +217,28 @@ class MatplotlibDrawer:
         bin_contents = thxxdata.get_bin_contents()
         stat_unc = thxxdata.get_stat_errors()
         
+        kwargs.setdefault("rasterized", self.is_rasterized(thxxdata))
         handle = self.axes[i_row].errorbar(x_bin_centers, bin_contents, xerr=x_bin_width/2., yerr=stat_unc, fmt=fmt, ms = ms, linewidth=0.5, **kwargs)
         if set_labels:
             self.hists_in_axes[i_row].append(handle)
             self.labels_in_axes[i_row].append(thxxdata.get_label_name())
             
-    #
+    # each sample is one filled layer between the cumulative sums below and including it
+    @timed("MatplotlibDrawer.draw_stack")
     def draw_stack(self, *thxxdatas, i_row, set_labels = True, normalisation = 1.):
     
-        stacks = 0
+        x_bin_edges = thxxdatas[0].get_bin_edges()
+        stack_tops = np.cumsum([thxxdata.get_bin_contents() for thxxdata in thxxdatas], axis=0)
+        stack_bottoms = np.concatenate([np.zeros((1, stack_tops.shape[1])), stack_tops[:-1]])
+
         info_for_labels = []
-        for index, thxxdata in enumerate(thxxdatas) :
-            
-            x_bin_centers = thxxdata.get_bin_centers()
-            x_bin_width = thxxdata.get_bin_widths()
-            bin_contents = thxxdata.get_bin_contents()
+        for thxxdata, stack_top, stack_bottom in zip(thxxdatas, stack_tops, stack_bottoms) :
             
             label_name = thxxdata.get_label_name()
             color = thxxdata.get_color()
             
-            handle = self.axes[i_row].bar(x_bin_centers, bin_contents, width = x_bin_width, bottom=stacks, color = color, alpha=0.7)
-            stacks = stacks + bin_contents
+            handle = self.axes[i_row].stairs(stack_top, x_bin_edges, baseline=stack_bottom, fill=True, color = color, alpha=0.7, linewidth=0,
+                                             rasterized=self.is_rasterized(thxxdata))
             info_for_labels.append((handle, label_name))
         
         if set_labels:
@@ -199,6 +246,7 @@ class MatplotlibDrawer:
                 self.hists_in_axes[i_row].append(handle)
                 self.labels_in_axes[i_row].append(label)
             
+    @timed("MatplotlibDrawer.draw_labels")
     def draw_labels(self, i_row, **kwargs) :
         self.axes[i_row].legend(tuple(self.hists_in_axes[i_row]), tuple(self.labels_in_axes[i_row]), **kwargs)
 
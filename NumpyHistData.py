@@ -0,0 +1,564 @@
+import numpy as np
+import json
+
+from helper import *
+from VariationStore import VariationStore
+from Profiler import timed
+from RootSession import track_object
+
+class NumpyHistData:
+
+    '''
+    Histogram kept as NumPy arrays, ROOT is not needed
+    bin_edges: n+1 edges, bin_contents and bin_sumw2: n visible bins
+    input_sample_arrays: [(sample_name, bin_contents, bin_sumw2)] of the summed inputs
+    variations: VariationStore of systematic variations or None
+    axis_edges: [x_edges, y_edges] for a 2D histogram, None for 1D
+                2D contents are flattened with x running fastest and bin_edges are index edges,
+                get_slices() makes 1D histograms from them
+
+    implements the accessors used by MatplotlibDrawer and the arithmetic,
+    THxxData and THxxDataWithSyst add reading from ROOT files on top of it
+    '''
+    def __init__(self, bin_edges, bin_contents, bin_sumw2, hist_label_name="", color="black", hist_name="",
+                 sample_names=None, input_sample_arrays=None, variations=None, axis_edges=None, fill_stats=None):
+
+        self.hist_name=hist_name
+        self.hist_label_name=hist_label_name
+        self.color=color
+
+        self.sample_names=[] if sample_names is None else list(sample_names)
+        self.input_sample_arrays=[] if input_sample_arrays is None else list(input_sample_arrays)
+
+        self.variations=variations
+        self.axis_edges=None
+        self.fill_stats=None if fill_stats is None else np.asarray(fill_stats, dtype=np.float64)
+        self.set_bin_arrays(np.asarray(bin_edges, dtype=np.float64), np.asarray(bin_contents, dtype=np.float64),
+                            np.asarray(bin_sumw2, dtype=np.float64))
+        if axis_edges is not None:
+            self.set_axis_edges(axis_edges)
+
+    def get_color(self) :
+        return self.color
+
+    def set_label_name(self, name):
+        self.hist_label_name = name
+
+    def get_label_name(self):
+        return self.hist_label_name
+
+    def print_input_sample_names(self):
+        for sample_name in self.sample_names:
+            print(sample_name)
+
+    def set_bin_arrays(self, bin_edges, bin_contents, bin_sumw2):
+        # arrays are not copied, they are made read-only and may be shared with other objects
+
+        for array in (bin_edges, bin_contents, bin_sumw2):
+            array.flags.writeable = False
+
+        self.bin_edges = bin_edges
+        self.bin_contents = bin_contents
+        self.bin_sumw2 = bin_sumw2
+        self.bin_errors = np.sqrt(bin_sumw2)
+        self.bin_errors.flags.writeable = False
+
+        self.reset_derived()
+        track_object(self)
+
+    def reset_derived(self):
+        # drop everything made from the bin arrays, it is made again when read
+        self.reset_total_errors()
+
+    def release_derived(self):
+        # free everything made from the arrays now instead of when the object is deleted, see RootSession
+        self.reset_derived()
+
+    def get_root_objects(self):
+        return []
+
+    def get_owned_arrays(self):
+        # arrays held by this object, some may be shared with other objects
+
+        arrays=[self.bin_edges, self.bin_contents, self.bin_sumw2, self.bin_errors]
+        for sample_name, bin_contents, bin_sumw2 in self.input_sample_arrays:
+            arrays.extend((bin_contents, bin_sumw2))
+        if self.variations is not None:
+            arrays.append(self.variations.raw_array)
+        return arrays
+
+    def reset_total_errors(self):
+
+        self.syst_error_array=None # (source, bin) uncertainty of each source
+        self.total_syst_arrays=None
+        self.total_error_arrays=None
+
+    def set_input_sample_arrays(self, input_sample_arrays):
+        self.input_sample_arrays=input_sample_arrays
+
+    def set_variations(self, variations):
+
+        self.variations=variations
+        self.reset_total_errors()
+
+    def set_axis_edges(self, axis_edges):
+        # interpret the bins as a flattened 2D histogram, e.g. unrolled with TUnfoldBinning
+
+        axis_edges=[np.asarray(edges, dtype=np.float64) for edges in axis_edges]
+        n_bins=int(np.prod([len(edges)-1 for edges in axis_edges]))
+        if n_bins != len(self.bin_contents):
+            raise ValueError("Axes with {} bins do not match histogram with {} bins".format(n_bins, len(self.bin_contents)))
+
+        for edges in axis_edges:
+            edges.flags.writeable=False
+        self.axis_edges=axis_edges
+        self.set_bin_arrays(get_index_edges(n_bins), self.bin_contents, self.bin_sumw2)
+
+    def get_axis_edges(self):
+        if self.axis_edges is None:
+            return [self.bin_edges]
+        return self.axis_edges
+
+    def get_bin_arrays(self):
+        return self.bin_edges, self.bin_contents, self.bin_errors
+
+    def get_bin_edges(self):
+        return self.bin_edges
+
+    def get_bin_centers(self):
+        return (self.bin_edges[:-1] + self.bin_edges[1:]) / 2.
+
+    def get_bin_contents(self):
+        return self.bin_contents
+
+    def get_bin_widths(self):
+        # widths along bin_edges, 1 for the index bins of a 2D histogram, see get_bin_areas()
+        return np.diff(self.bin_edges)
+
+    def get_bin_areas(self):
+        # bin widths, or x width times y width of each bin of a 2D histogram as TH2::Scale(1, "width")
+
+        if self.axis_edges is None:
+            return self.get_bin_widths()
+        return np.outer(np.diff(self.axis_edges[1]), np.diff(self.axis_edges[0])).ravel()
+
+    def get_stat_errors(self, variation_direction=up_down.up):
+        # up and down statistical errors are both the bin errors of central histogram
+        return self.bin_errors
+
+    def get_syst_delta_array(self):
+        # (variation, bin) delta from the central contents
+        return self.variations.get_delta_array(self.get_bin_contents())
+
+    def get_syst_error_array(self):
+
+        if self.syst_error_array is None:
+            self.set_total_syst_arrays()
+        return self.syst_error_array
+
+    def get_syst_errors(self, syst_name):
+        # uncertainty of one systematic source, variations combined with its rule
+        return self.get_syst_error_array()[self.variations.source_index[syst_name]]
+
+    def get_covariance_factors(self):
+        # {syst_name: factors (factor, bin)} with covariance factors.T @ factors for each source
+        # memory grows with the number of variations times bins, not bins squared
+
+        if self.variations is None:
+            return {}
+        return self.variations.get_factors(self.get_syst_delta_array())
+
+    def get_covariance(self, syst_names=None, include_stat=False):
+        # full (bin, bin) covariance matrix summed over syst_names, all sources if None
+        # include_stat adds the statistical variance to the diagonal
+
+        covariance_factors=self.get_covariance_factors()
+        if syst_names is None:
+            syst_names=list(covariance_factors)
+
+        factors=[covariance_factors[syst_name] for syst_name in syst_names if syst_name in covariance_factors]
+        factors=np.concatenate(factors) if factors else np.zeros((0, len(self.bin_contents)))
+        covariance=factors.T @ factors
+        if include_stat:
+            covariance[np.diag_indices_from(covariance)]+=self.bin_sumw2
+        return covariance
+
+    def get_correlation(self, syst_names=None, include_stat=False):
+
+        covariance=self.get_covariance(syst_names, include_stat)
+        errors=np.sqrt(np.diag(covariance))
+        return divide_arrays(covariance, np.outer(errors, errors))
+
+    def get_total_syst_errors(self, variation_direction=up_down.up):
+
+        if self.total_syst_arrays is None:
+            self.set_total_syst_arrays()
+        return self.total_syst_arrays[variation_direction]
+
+    def get_total_errors(self, variation_direction=up_down.up):
+
+        if self.total_error_arrays is None:
+            self.set_total_error_arrays()
+        return self.total_error_arrays[variation_direction]
+
+    @timed("NumpyHistData.set_total_syst_arrays")
+    def set_total_syst_arrays(self):
+
+        # combine variations of each source, then squared sum over sources
+        if self.variations is None:
+            self.syst_error_array=np.zeros((0, len(self.bin_contents)))
+        else:
+            self.syst_error_array=self.variations.combine(self.get_syst_delta_array())
+        total_syst=np.sqrt(np.sum(np.square(self.syst_error_array), axis=0))
+
+        self.total_syst_arrays=np.array([total_syst, total_syst]) # up, down
+        self.total_syst_arrays.flags.writeable=False
+
+    def set_total_error_arrays(self):
+        # syst+stat
+
+        stat_up=self.get_stat_errors()
+        total_syst_up=self.get_total_syst_errors(up_down.up)
+        total_syst_down=self.get_total_syst_errors(up_down.down)
+        self.total_error_arrays=np.sqrt(np.square([total_syst_up, total_syst_down])+np.square(stat_up))
+        self.total_error_arrays.flags.writeable=False
+
+    def get_mean_range(self, x_start=0, x_end=0, slice_axis=1):
+        # (centers of the bins in [x_start, x_end], mask of those bins) along the axis the mean is taken
+        # the whole range if x_start == x_end
+
+        bin_edges=self.bin_edges if self.axis_edges is None else self.axis_edges[1-slice_axis]
+        bin_centers=(bin_edges[:-1]+bin_edges[1:])/2.
+        in_range=np.ones(len(bin_centers), dtype=bool)
+        if x_start != x_end:
+            in_range=(bin_centers >= x_start) & (bin_centers <= x_end)
+        return bin_centers[in_range], in_range
+
+    def get_means(self, x_start=0, x_end=0, slice_axis=1):
+        # means of the bins with centers in [x_start, x_end], the whole range if x_start == x_end
+        # computed at once for the central contents and all variations, and for every slice of a 2D histogram
+        # returns {"mean", "stat_error", "syst_error", "syst_errors" (source, ...), "variation_means" (variation, ...)}
+
+        if self.axis_edges is None:
+            bin_contents=self.bin_contents
+            bin_sumw2=self.bin_sumw2
+            raw_array=None if self.variations is None else self.variations.raw_array
+        else:
+            bin_contents=self.get_slice_array(self.bin_contents, slice_axis)
+            bin_sumw2=self.get_slice_array(self.bin_sumw2, slice_axis)
+            raw_array=None if self.variations is None else self.get_slice_array(self.variations.raw_array, slice_axis)
+
+        bin_centers, in_range = self.get_mean_range(x_start, x_end, slice_axis)
+        mean, stat_error = get_binned_means(bin_centers, bin_contents[..., in_range], bin_sumw2[..., in_range])
+        means={"mean": mean, "stat_error": stat_error, "syst_error": np.zeros_like(mean), "syst_errors": None, "variation_means": None}
+
+        if raw_array is not None:
+            variation_means, _ = get_binned_means(bin_centers, raw_array[..., in_range])
+            means["variation_means"]=variation_means
+            means["syst_errors"]=self.variations.combine(variation_means-mean)
+            means["syst_error"]=np.sqrt(np.sum(np.square(means["syst_errors"]), axis=0))
+
+        return means
+
+    def get_mean(self, x_start=0, x_end=0, reset_stat=False):
+        # (mean, error) of the bins with centers in [x_start, x_end], see get_means()
+        # the whole range mean is taken from the statistics ROOT kept while filling if known, unless reset_stat
+
+        if not reset_stat and x_start == x_end and self.fill_stats is not None and self.fill_stats[0] != 0:
+            return get_stats_mean(self.fill_stats)
+
+        means=self.get_means(x_start, x_end)
+        return means["mean"], means["stat_error"]
+
+    def get_variation_contents(self, variations):
+        # raw contents in the layout of variations, sources not in this object are taken as central
+
+        if self.variations is not None and variations.syst_names == self.variations.syst_names:
+            return self.variations.raw_array
+
+        raw_array=np.broadcast_to(self.get_bin_contents(), variations.raw_array.shape)
+        if self.variations is None:
+            return raw_array
+
+        raw_array=raw_array.copy()
+        for syst_name in variations.syst_names:
+            if syst_name in self.variations.syst_names:
+                raw_array[variations.rows_of(syst_name)]=self.variations.get_raw(syst_name)
+        return raw_array
+
+    def scale_bins(self, scale):
+        # scale: number or array with one factor per bin
+
+        self.set_bin_arrays(self.bin_edges, self.bin_contents*scale, self.bin_sumw2*np.square(scale))
+        # fill statistics are scaled as TH1::Scale() does, they are lost with a factor per bin
+        if self.fill_stats is not None:
+            self.fill_stats=self.fill_stats*np.array([scale, scale*scale, scale, scale]) if np.ndim(scale)==0 else None
+        if self.variations is not None:
+            self.set_variations(self.variations.with_raw_array(self.variations.raw_array*scale))
+
+    def divide_bin_width(self) :
+        self.scale_bins(1./self.get_bin_areas())
+
+    def normalize(self, shape_only=False) :
+        # shape_only: each variation is normalized to its own integral, only shape differences remain
+
+        raw_array=None
+        if shape_only and self.variations is not None:
+            raw_array=divide_arrays(self.variations.raw_array, np.sum(self.variations.raw_array, axis=-1, keepdims=True))
+        self.scale_bins(1./np.sum(self.bin_contents))
+        if raw_array is not None:
+            self.set_variations(self.variations.with_raw_array(raw_array))
+
+    def get_rebin_starts(self, new_edges=None, merge_groups=None):
+        # (first old bin of each new bin, end of the last new bin), see rebin()
+
+        n_bins=len(self.bin_contents)
+        if new_edges is not None:
+            new_edges=np.asarray(new_edges, dtype=np.float64)
+            # nearest old edge of each new edge
+            edge_index=np.clip(np.searchsorted(self.bin_edges, new_edges), 1, n_bins)
+            edge_index=np.where(np.abs(self.bin_edges[edge_index-1]-new_edges) < np.abs(self.bin_edges[edge_index]-new_edges),
+                                edge_index-1, edge_index)
+            if len(new_edges) < 2 or not np.allclose(self.bin_edges[edge_index], new_edges) or np.any(np.diff(edge_index) <= 0):
+                raise ValueError("new_edges must be increasing edges of the current binning")
+            return edge_index[:-1], edge_index[-1]
+
+        if np.isscalar(merge_groups):
+            if merge_groups <= 0 or n_bins % merge_groups != 0:
+                raise ValueError("{} bins can not be merged in groups of {}".format(n_bins, merge_groups))
+            merge_groups=[merge_groups]*(n_bins//merge_groups)
+        merge_groups=np.asarray(merge_groups, dtype=int)
+        if np.any(merge_groups <= 0) or np.sum(merge_groups) != n_bins:
+            raise ValueError("merge_groups must be positive and add up to {} bins".format(n_bins))
+        return np.concatenate(([0], np.cumsum(merge_groups)[:-1])), n_bins
+
+    @timed("NumpyHistData.rebin")
+    def rebin(self, new_edges=None, merge_groups=None):
+        # new object with merged bins, stat and total uncertainties are computed again from the merged arrays
+        # new_edges: subset of the current edges, bins outside them are dropped
+        # merge_groups: number of bins in each new bin, or one number for all
+        # central, per-sample and variation arrays are each merged with one np.add.reduceat
+
+        if self.axis_edges is not None:
+            raise ValueError("rebin() needs a 1D histogram, see get_slices()")
+
+        starts, end = self.get_rebin_starts(new_edges, merge_groups)
+        def merge_bins(array):
+            return np.add.reduceat(array[..., :end], starts, axis=-1)
+
+        rebinned_=self.make_result(merge_bins(self.bin_contents), merge_bins(self.bin_sumw2), self.bin_edges[np.append(starts, end)])
+        rebinned_.fill_stats=self.fill_stats # kept as TH1::Rebin() does
+
+        if self.input_sample_arrays:
+            input_sample_names=[sample_name for sample_name, contents, sumw2 in self.input_sample_arrays]
+            input_sample_contents=merge_bins(np.array([contents for sample_name, contents, sumw2 in self.input_sample_arrays]))
+            input_sample_sumw2=merge_bins(np.array([sumw2 for sample_name, contents, sumw2 in self.input_sample_arrays]))
+            rebinned_.set_input_sample_arrays(list(zip(input_sample_names, input_sample_contents, input_sample_sumw2)))
+        if self.variations is not None:
+            rebinned_.set_variations(self.variations.with_raw_array(merge_bins(self.variations.raw_array)))
+
+        return rebinned_
+
+    def make_result(self, bin_contents, bin_sumw2, bin_edges=None):
+        # new object sharing everything with self except the central bin arrays
+        # nothing is deep copied, shared members are not modified by the operators
+        # fill statistics do not describe the new contents, callers set them where they are known
+
+        result_=object.__new__(type(self))
+        result_.__dict__.update(self.__dict__)
+        result_.fill_stats=None
+        result_.set_bin_arrays(self.bin_edges if bin_edges is None else bin_edges, bin_contents, bin_sumw2)
+
+        return result_
+
+    @timed("NumpyHistData.divide")
+    def divide(self, other, correlated=False):
+        # ratio histogram with systematic info
+        # correlated: the sources of both objects are propagated, a source found in both is varied
+        # in the numerator and the denominator together so shared uncertainties cancel,
+        # a source of only one of them is divided by or divides the central contents of the other
+        # otherwise only the variations of self are divided by the central contents of other
+
+        bin_contents=divide_arrays(self.bin_contents, other.bin_contents)
+        bin_sumw2=divide_sumw2(self.bin_contents, self.bin_sumw2, other.bin_contents, other.bin_sumw2)
+
+        ratio_=self.make_result(bin_contents, bin_sumw2)
+        if correlated:
+            variations=get_union_variations([self, other])
+            if variations is not None:
+                ratio_.set_variations(variations.with_raw_array(divide_arrays(self.get_variation_contents(variations),
+                                                                              other.get_variation_contents(variations))))
+        elif self.variations is not None:
+            ratio_.set_variations(self.variations.with_raw_array(divide_arrays(self.variations.raw_array, other.get_bin_contents())))
+
+        return ratio_
+
+    def __truediv__(self, other):
+        # operator overloading for ratio histogram with systematic info, see divide()
+        # keeps the uncorrelated behaviour, systematics of other are not propagated, use divide(other, correlated=True)
+        return self.divide(other)
+
+    @timed("NumpyHistData.add_all")
+    def add_all(self, others):
+        # self+others[0]+others[1]+... making only one result object
+
+        bin_contents=self.bin_contents
+        bin_sumw2=self.bin_sumw2
+        for other in others:
+            bin_contents=bin_contents+other.bin_contents
+            bin_sumw2=bin_sumw2+other.bin_sumw2
+
+        sum_=self.make_result(bin_contents, bin_sumw2)
+        # fill statistics add up as in TH1::Add()
+        if all(thxxdata.fill_stats is not None for thxxdata in [self]+list(others)):
+            sum_.fill_stats=self.fill_stats+sum(other.fill_stats for other in others)
+        variations=get_union_variations([self]+list(others))
+        if variations is not None:
+            # sources of all operands, each taken as central contents where it is missing, so a+b == b+a
+            raw_array=self.get_variation_contents(variations)
+            for other in others:
+                raw_array=raw_array+other.get_variation_contents(variations)
+            sum_.set_variations(variations.with_raw_array(raw_array))
+
+        return sum_
+
+    def __add__(self, other):
+        return self.add_all([other])
+
+    def __radd__(self, other):
+        # allow sum() which starts from 0
+        if isinstance(other, (int, float)) and other == 0:
+            return self
+        return NotImplemented
+
+    def get_slice_array(self, array, slice_axis=1):
+        # (..., bin) of a 2D histogram to (..., bin of slice_axis, bin of the other axis)
+
+        bin_shape=(len(self.axis_edges[1])-1, len(self.axis_edges[0])-1) # (y, x)
+        array=array.reshape(array.shape[:-1]+bin_shape)
+        if slice_axis==0:
+            array=np.swapaxes(array, -1, -2)
+        return array
+
+    def get_slices(self, slice_axis=1):
+        # 1D histograms along the other axis, one for each bin of slice_axis of a 2D histogram
+        # all slices are made in one pass as views of the arrays of this object, variations included
+
+        if self.axis_edges is None or len(self.axis_edges) != 2:
+            raise ValueError("get_slices() needs a 2D histogram")
+
+        n_bins=len(self.bin_contents)
+
+        # (..., bin) to (slice, ..., bin in the slice)
+        def to_slices(array):
+            return np.moveaxis(self.get_slice_array(array, slice_axis), -2, 0)
+
+        slice_edges=self.axis_edges[1-slice_axis]
+        slice_contents=to_slices(self.bin_contents)
+        slice_sumw2=to_slices(self.bin_sumw2)
+
+        input_sample_names=[sample_name for sample_name, contents, sumw2 in self.input_sample_arrays]
+        slice_sample_contents=to_slices(np.array([contents for sample_name, contents, sumw2 in self.input_sample_arrays]).reshape((-1, n_bins)))
+        slice_sample_sumw2=to_slices(np.array([sumw2 for sample_name, contents, sumw2 in self.input_sample_arrays]).reshape((-1, n_bins)))
+
+        slice_raw_arrays=None
+        if self.variations is not None:
+            slice_raw_arrays=to_slices(self.variations.raw_array)
+
+        slices=[]
+        for index in range(len(slice_contents)):
+            variations=None
+            if slice_raw_arrays is not None:
+                variations=self.variations.with_raw_array(slice_raw_arrays[index])
+            slices.append(NumpyHistData(slice_edges, slice_contents[index], slice_sumw2[index],
+                                        hist_label_name=self.hist_label_name, color=self.color, hist_name=self.hist_name+"_"+str(index),
+                                        sample_names=self.sample_names,
+                                        input_sample_arrays=list(zip(input_sample_names, slice_sample_contents[index], slice_sample_sumw2[index])),
+                                        variations=variations))
+        return slices
+
+    def get_arrays(self):
+        # (arrays, metadata) with everything needed to make this object again, see make_from_arrays()
+
+        n_bins=len(self.bin_contents)
+        arrays={
+            "bin_edges": self.bin_edges,
+            "bin_contents": self.bin_contents,
+            "bin_sumw2": self.bin_sumw2,
+            "input_sample_contents": np.array([contents for sample_name, contents, sumw2 in self.input_sample_arrays]).reshape((-1, n_bins)),
+            "input_sample_sumw2": np.array([sumw2 for sample_name, contents, sumw2 in self.input_sample_arrays]).reshape((-1, n_bins)),
+        }
+        metadata={
+            "hist_name": self.hist_name,
+            "hist_label_name": self.hist_label_name,
+            "color": self.color,
+            "sample_names": self.sample_names,
+            "input_sample_names": [sample_name for sample_name, contents, sumw2 in self.input_sample_arrays],
+            "syst_names": None,
+            "syst_rules": None,
+        }
+        if self.axis_edges is not None:
+            for axis, edges in enumerate(self.axis_edges):
+                arrays["axis_edges_"+str(axis)]=edges
+        if self.fill_stats is not None:
+            arrays["fill_stats"]=self.fill_stats
+        if self.variations is not None:
+            arrays["syst_raw_array"]=self.variations.raw_array
+            metadata["syst_names"]=self.variations.syst_names
+            metadata["syst_rules"]=self.variations.syst_rules
+
+        return arrays, metadata
+
+    def to_numpy(self):
+        # NumpyHistData sharing the arrays of this object
+        return make_from_arrays(*self.get_arrays())
+
+    def save_npz(self, out_name):
+        # can be read with load_npz() where ROOT is not installed
+
+        arrays, metadata = self.get_arrays()
+        np.savez(out_name, metadata=np.array(json.dumps(metadata)), **arrays)
+
+def get_axis_edges_from_arrays(arrays):
+    # axis_edges saved by get_arrays(), None for 1D histograms
+
+    axis_edges=[]
+    while "axis_edges_"+str(len(axis_edges)) in arrays:
+        axis_edges.append(arrays["axis_edges_"+str(len(axis_edges))])
+    return axis_edges if axis_edges else None
+
+def make_from_arrays(arrays, metadata):
+
+    variations=None
+    if metadata["syst_names"] is not None:
+        variations=VariationStore(metadata["syst_names"], len(arrays["bin_contents"]), metadata["syst_rules"])
+        variations.raw_array=arrays["syst_raw_array"]
+
+    input_sample_arrays=list(zip(metadata["input_sample_names"], arrays["input_sample_contents"], arrays["input_sample_sumw2"]))
+
+    return NumpyHistData(arrays["bin_edges"], arrays["bin_contents"], arrays["bin_sumw2"],
+                         hist_label_name=metadata["hist_label_name"], color=metadata["color"], hist_name=metadata["hist_name"],
+                         sample_names=metadata["sample_names"], input_sample_arrays=input_sample_arrays, variations=variations,
+                         axis_edges=get_axis_edges_from_arrays(arrays), fill_stats=arrays.get("fill_stats"))
+
+def load_npz(in_name):
+
+    with np.load(in_name, allow_pickle=False) as npz_file:
+        arrays={name: npz_file[name] for name in npz_file.files}
+    metadata=json.loads(str(arrays.pop("metadata")))
+
+    return make_from_arrays(arrays, metadata)
+
+def get_union_variations(thxxdatas):
+    # VariationStore layout with the sources of all objects, None if none has variations
+
+    stores=[thxxdata.variations for thxxdata in thxxdatas if thxxdata.variations is not None]
+    if not stores:
+        return None
+    return stores[0].union(stores[1:])
+
+def sum_data(thxxdatas):
+    # sum of a list of THxxData or THxxDataWithSyst without intermediate objects
+
+    thxxdatas=list(thxxdatas)
+    return thxxdatas[0].add_all(thxxdatas[1:])
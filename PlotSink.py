@@ -0,0 +1,63 @@
+import os
+
+from matplotlib.backends.backend_pdf import PdfPages
+
+from Profiler import timed
+
+class PlotSink:
+
+    '''
+    Output of many plots as they are made: pages of one multi-page PDF and files in other formats
+    pdf_name: PDF every plot is added to as a page, None to not make one
+    formats: formats written for each plot, e.g. ["png"], named by the out_name given to add()
+    dpi: resolution of raster formats and rasterized data
+
+        with PlotSink("all_plots.pdf", formats=["png"]) as sink:
+            for ...:
+                drawer.draw_...
+                sink.add(drawer, "thumbnails/dilep_pt_mm40to64")
+                drawer.clear_artists()
+    '''
+    def __init__(self, pdf_name=None, formats=(), dpi=100, pdf_metadata=None):
+
+        self.pdf_name=pdf_name
+        self.formats=list(formats)
+        self.dpi=dpi
+        self.n_plots=0
+
+        self.pdf_pages=None
+        if self.pdf_name is not None:
+            self.pdf_pages=PdfPages(self.pdf_name, metadata=pdf_metadata)
+
+    @timed("PlotSink.add")
+    def add(self, plot, out_name=None):
+        # plot: MatplotlibDrawer or matplotlib Figure
+        # out_name: file name without extension for formats, needed if formats are given
+
+        fig=getattr(plot, "fig", plot)
+        if self.pdf_pages is not None:
+            self.pdf_pages.savefig(fig, dpi=self.dpi)
+
+        if self.formats:
+            if out_name is None:
+                raise ValueError("out_name is needed to write " + ", ".join(self.formats))
+            out_dir=os.path.dirname(out_name)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            for out_format in self.formats:
+                fig.savefig(out_name + "." + out_format, format=out_format, dpi=self.dpi)
+
+        self.n_plots+=1
+
+    def close(self):
+        # finish the multi-page PDF, it can not be read before
+
+        if self.pdf_pages is not None:
+            self.pdf_pages.close()
+            self.pdf_pages=None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
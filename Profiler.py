@@ -0,0 +1,128 @@
+import time
+import json
+import functools
+import contextlib
+
+class Profiler:
+
+    '''
+    Wall time, number of calls and bytes read of named stages
+    times are inclusive, a stage running inside another one is counted in both
+
+    profiling is off unless enabled:
+        profiler=enable_profiling()
+        ... read histograms and draw ...
+        profiler.print_summary()
+    '''
+    def __init__(self):
+        self.stages={} # stage name: [n_calls, wall time, bytes read]
+
+    def add(self, name, wall_time=0., n_calls=1, bytes_read=0):
+
+        if name not in self.stages:
+            self.stages[name]=[0, 0., 0]
+        self.stages[name][0]+=n_calls
+        self.stages[name][1]+=wall_time
+        self.stages[name][2]+=bytes_read
+
+    def stage(self, name, root_file=None):
+        return StageTimer(self, name, root_file)
+
+    def reset(self):
+        self.stages.clear()
+
+    def get_summary(self):
+        # one dictionary per stage, longest first
+
+        summary=[{"stage": name, "n_calls": n_calls, "time": wall_time, "bytes_read": bytes_read}
+                 for name, (n_calls, wall_time, bytes_read) in self.stages.items()]
+        return sorted(summary, key=lambda item: item["time"], reverse=True)
+
+    def to_json(self):
+        return json.dumps(self.get_summary(), indent=1)
+
+    def save_json(self, out_name):
+
+        with open(out_name, "w") as out_file:
+            out_file.write(self.to_json())
+
+    def print_summary(self):
+
+        print("{:<40} {:>8} {:>12} {:>14} {:>12}".format("stage", "calls", "time [s]", "per call [ms]", "read [MB]"))
+        for item in self.get_summary():
+            print("{:<40} {:>8} {:>12.4f} {:>14.4f} {:>12.3f}".format(item["stage"], item["n_calls"], item["time"],
+                                                                     item["time"]/max(item["n_calls"], 1)*1e3, item["bytes_read"]/1e6))
+
+class StageTimer:
+
+    '''
+    Context manager adding one call of a stage to a Profiler
+    root_file: TFile whose bytes read during the stage are added to it
+    '''
+    def __init__(self, profiler, name, root_file=None):
+
+        self.profiler=profiler
+        self.name=name
+        self.root_file=root_file
+
+    def __enter__(self):
+
+        if self.root_file is not None:
+            self.start_bytes=self.root_file.GetBytesRead()
+        self.start_time=time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        wall_time=time.perf_counter()-self.start_time
+        bytes_read=0
+        if self.root_file is not None:
+            bytes_read=self.root_file.GetBytesRead()-self.start_bytes
+        self.profiler.add(self.name, wall_time, bytes_read=bytes_read)
+
+active_profiler=None # Profiler in use, None if profiling is off
+
+null_stage=contextlib.nullcontext() # used for every stage while profiling is off
+
+def enable_profiling(profiler=None):
+
+    global active_profiler
+    active_profiler=Profiler() if profiler is None else profiler
+    return active_profiler
+
+def disable_profiling():
+    # returns the profiler used until now
+
+    global active_profiler
+    profiler=active_profiler
+    active_profiler=None
+    return profiler
+
+def get_profiler():
+    return active_profiler
+
+def stage(name, root_file=None):
+    # with stage("name"): ... times the block, costs one check if profiling is off
+
+    if active_profiler is None:
+        return null_stage
+    return active_profiler.stage(name, root_file)
+
+def add_bytes_read(name, root_file):
+    # add all bytes read so far from root_file, e.g. right after opening it
+
+    if active_profiler is not None:
+        active_profiler.add(name, n_calls=0, bytes_read=root_file.GetBytesRead())
+
+def timed(name):
+    # decorator timing every call of a function as stage name
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if active_profiler is None:
+                return function(*args, **kwargs)
+            with active_profiler.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
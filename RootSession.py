@@ -0,0 +1,113 @@
+import gc
+import sys
+import weakref
+import itertools
+
+class RootSession:
+
+    '''
+    Long running session (notebook, daemon) keeping the memory of ROOT objects bounded
+
+    - TH1.AddDirectory(False): new histograms are not owned by gDirectory and are freed with their python object
+    - ROOT objects made by this package get unique names, see get_root_name()
+    - canvases of make_plot() are closed after saving
+    - free() drops the ROOT histograms cached by live data objects, they are made again from the bin arrays when used
+    - report() counts live data objects, their ROOT histograms and bytes
+
+        with RootSession() as session:
+            ...
+            session.free()
+            print(session.report())
+    '''
+    def __init__(self):
+
+        self.name_counter=itertools.count()
+        self.data_objects=weakref.WeakSet() # NumpyHistData made while the session is active
+        self.add_directory_status=None
+
+    def start(self):
+
+        global active_session
+        rt=get_root()
+        if rt is not None:
+            self.add_directory_status=rt.TH1.AddDirectoryStatus()
+            rt.TH1.AddDirectory(False)
+        active_session=self
+        return self
+
+    def stop(self):
+
+        global active_session
+        self.free()
+        rt=get_root()
+        if rt is not None and self.add_directory_status is not None:
+            rt.TH1.AddDirectory(self.add_directory_status)
+        if active_session is self:
+            active_session=None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def free(self):
+        # release ROOT histograms of every live data object and collect unreachable objects now
+
+        for data_object in list(self.data_objects):
+            data_object.release_derived()
+        gc.collect()
+
+    def report(self):
+
+        # objects and arrays shared by several data objects are counted once
+        data_objects=list(self.data_objects)
+        root_objects={id(root_object): root_object for data_object in data_objects for root_object in data_object.get_root_objects()}
+        arrays={id(array): array for data_object in data_objects for array in data_object.get_owned_arrays()}
+        report={
+            "data_objects": len(data_objects),
+            "array_bytes": sum(array.nbytes for array in arrays.values()),
+            "root_hists": len(root_objects),
+            "root_hist_bytes": sum(get_hist_bytes(root_object) for root_object in root_objects.values()),
+        }
+
+        # ROOT global lists, only if ROOT is already in use
+        if "ROOT" in sys.modules:
+            rt=sys.modules["ROOT"]
+            report["gdirectory_objects"]=rt.gDirectory.GetList().GetSize()
+            report["canvases"]=rt.gROOT.GetListOfCanvases().GetSize()
+            report["files"]=rt.gROOT.GetListOfFiles().GetSize()
+
+        return report
+
+active_session=None # RootSession in use, None outside of a session
+
+def get_root():
+
+    try:
+        import ROOT
+    except ImportError:
+        return None
+    return ROOT
+
+def get_hist_bytes(thist):
+    # contents and sumw2 of all cells
+    return thist.GetNcells()*8*(2 if thist.GetSumw2N() > 0 else 1)
+
+def get_root_name(name):
+    # unique name for a new ROOT object inside a session, name itself outside
+
+    if active_session is None:
+        return name
+    return name+"_"+str(next(active_session.name_counter))
+
+def track_object(data_object):
+
+    if active_session is not None:
+        active_session.data_objects.add(data_object)
+
+def close_canvas(canvas):
+    # canvases stay in the global list of ROOT until closed
+
+    if active_session is not None:
+        canvas.Close()
@@ -0,0 +1,99 @@
+import numpy as np
+
+from multiprocessing import shared_memory
+
+from NumpyHistData import make_from_arrays
+
+class SharedHistStore:
+
+    '''
+    Bin arrays of loaded data objects in one shared memory block, see NumpyHistData.get_arrays()
+    workers attach to the block with a small handle and get read-only NumpyHistData without copying
+
+        with SharedHistStore({"data": data_hist, "dy": dy_hist}) as store:
+            handle=store.get_handle() # picklable, send it to the workers
+            ...
+            # in a worker
+            dy_hist=get_shared_hist(handle, "dy")
+
+    the block is removed by close(), workers must be done with it before
+    '''
+    def __init__(self, hists):
+
+        self.layout={} # hist_key: {"arrays": {name: (offset, shape, dtype)}, "metadata": metadata}
+        exported_arrays=[]
+        size=0
+        for hist_key, hist in hists.items():
+            arrays, metadata = hist.get_arrays()
+            self.layout[hist_key]={"arrays": {}, "metadata": metadata}
+            for name, array in arrays.items():
+                array=np.ascontiguousarray(array)
+                size=(size+63)//64*64 # aligned start of every array
+                self.layout[hist_key]["arrays"][name]=(size, array.shape, array.dtype.str)
+                exported_arrays.append((size, array))
+                size+=array.nbytes
+
+        self.shared_memory=shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for offset, array in exported_arrays:
+            np.ndarray(array.shape, array.dtype, buffer=self.shared_memory.buf, offset=offset)[...]=array
+
+    def get_handle(self):
+        return {"name": self.shared_memory.name, "layout": self.layout}
+
+    def close(self):
+        # release and remove the block
+
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+attached_memory={} # block name: SharedMemory, kept open while its arrays are used
+attached_hists={} # block name: {hist_key: NumpyHistData}
+
+def attach_memory(name):
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 always tracks the block, worker processes share the resource tracker
+        # of the process that made the block, so it is still removed only by close()
+        return shared_memory.SharedMemory(name=name)
+
+def attach(handle):
+    # {hist_key: read-only NumpyHistData} viewing the block of a SharedHistStore, made once per process
+
+    name=handle["name"]
+    if name not in attached_hists:
+        attached_memory[name]=attach_memory(name)
+        hists={}
+        for hist_key, hist_layout in handle["layout"].items():
+            arrays={}
+            for array_name, (offset, shape, dtype) in hist_layout["arrays"].items():
+                arrays[array_name]=np.ndarray(tuple(shape), np.dtype(dtype), buffer=attached_memory[name].buf, offset=offset)
+                arrays[array_name].flags.writeable=False
+            hists[hist_key]=make_from_arrays(arrays, hist_layout["metadata"])
+        attached_hists[name]=hists
+
+    return attached_hists[name]
+
+def get_shared_hist(handle, hist_key):
+    # e.g. DataReference(get_shared_hist, handle, "dy") in BatchPlotter
+    return attach(handle)[hist_key]
+
+def detach(handle):
+    # forget the objects of a block and close it in this process, they must not be used afterwards
+
+    name=handle["name"]
+    attached_hists.pop(name, None)
+    if name not in attached_memory:
+        return
+    try:
+        attached_memory[name].close()
+    except BufferError:
+        return # arrays of the block are still referenced, it stays open
+    del attached_memory[name]
@@ -1,173 +1,204 @@
-import ROOT as rt
 import numpy as np
 import math
 import THxxData
-import copy
 
 from helper import *
+from HistogramCatalog import get_catalog
+from Profiler import timed
+from RootSession import get_root_name, close_canvas
+from NumpyHistData import NumpyHistData, sum_data, get_axis_edges_from_arrays
 
-class THxxData: # class RootHistData
+class THxxData(NumpyHistData): # class RootHistData
 
     '''
     TUnfoldxxData
     input: histogram using TUnfoldBinning 
+    input_root_files: list of (sample_name, root_file) or HistogramCatalog
+    n_workers: number of processes to read the input files with, 0 reads them one by one
+               for many observables load() them in bulk into a shared HistogramCatalog instead
+    cache: HistogramCache to keep the bin arrays between runs, None to always read ROOT files
+    unrolled_axes: [x_edges, y_edges] or TUnfoldBinning node if the input TH1D is an unrolled 2D histogram,
+                   TH2D inputs are flattened without it, see NumpyHistData.get_slices()
     
+    central contents are kept as bin arrays (see NumpyHistData), central_thist is made from them when first used
+    modify the central histogram through set_bin_arrays() or by assigning central_thist
+    ROOT is only imported when a ROOT file is read or a ROOT histogram is made
     '''
-    def __init__(self, input_root_files, hist_name, hist_label_name, color, set_mean_value = False):
+    def __init__(self, input_root_files, hist_name, hist_label_name, color, set_mean_value = False, n_workers = 0, cache = None, unrolled_axes = None):
         
         self.hist_name=hist_name # histogram name to read 
         self.hist_label_name=hist_label_name # histogram label to write in output plot
         
         self.sample_names=[]
+        self.input_sample_arrays=[] # (sample_name, bin_contents, bin_sumw2) of each input histogram
         
-        self.input_thists=[]
         self.color = color
 
-        self.stat_unc_hists=[]
+        self.variations=None
+        self.axis_edges=None
+        self.fill_stats=None
+        self.central_thist_cache=None
+        self.stat_unc_hists_cache=None
+        self.input_thists_cache=None
         
-        # open root file
+        # a temporary catalog is made if a list of files is given
+        catalog, temporary_catalog = get_catalog(input_root_files)
+
+        # cache: HistogramCache, ROOT files are not opened if the arrays are found in it
+        cache_key=None
+        if cache is not None:
+            cache_key=cache.make_key(catalog.input_root_files, [self.hist_name])
+        cached_arrays=None
+        if cache_key is not None:
+            cached_arrays=cache.load(cache_key)
+
+        if cached_arrays is not None:
+            self.set_cache_arrays(cached_arrays)
+        else:
+            self.read_input_hists(catalog, n_workers)
+            if cache_key is not None:
+                cache.save(cache_key, self.get_cache_arrays())
+
+        if temporary_catalog:
+            catalog.clear()
+        else:
+            catalog.release(self.hist_name)
+
+        if unrolled_axes is not None:
+            self.set_axis_edges(get_unrolled_axis_edges(unrolled_axes))
+
+    @timed("THxxData.read_input_hists")
+    def read_input_hists(self, catalog, n_workers = 0):
+
+        if n_workers > 1:
+            catalog.load(self.hist_name, n_workers=n_workers)
+
         first_file=True
-        for sample_name, root_file in input_root_files: 
-            temp_file=rt.TFile.Open(root_file, "READ")
+        for sample_name, temp_thist in catalog.get_sample_hists(self.hist_name):
             self.sample_names.append(sample_name)
             
             # read central histogram 
-            temp_thist=temp_file.Get(self.hist_name)
-            if type(temp_thist) == rt.TH1D : # check if histogram exist
-                temp_thist.Sumw2()
-                temp_thist.SetDirectory(0)
+            if temp_thist is not None : # check if histogram exist
                 if first_file:
-                    self.central_thist=temp_thist 
+                    central_thist=temp_thist.Clone(get_root_name(self.hist_name))
+                    central_thist.SetDirectory(0)
                 else:
-                    self.central_thist.Add(temp_thist,1)
+                    central_thist.Add(temp_thist,1)
                     
-                temp_thist_raw=temp_thist.Clone(sample_name)
-                temp_thist_raw.SetDirectory(0)
-                self.input_thists.append(temp_thist_raw)
+                bin_edges, bin_contents, bin_sumw2 = get_hist_arrays(temp_thist)
+                self.input_sample_arrays.append((sample_name, bin_contents, bin_sumw2))
             
             first_file=False
-            temp_file.Close()
 
-        self.set_stat_unc_hists()
+        self.central_thist=central_thist
 
-    def get_mean(self, x_start=0, x_end=0, reset_stat=False) :
-        if reset_stat :
-            temp_hist = self.central_thist.Clone("cloned_hist")
-            temp_hist.ResetStats()
-            if x_start == x_end :
-                return temp_hist.GetMean(), temp_hist.GetMeanError()
-        else :
-            if x_start == x_end :
-                return self.central_thist.GetMean(), self.central_thist.GetMeanError()
+    def get_cache_arrays(self):
+        # arrays to save in HistogramCache, systematic variations are cached by THxxDataWithSyst
 
-    def divide_bin_width(self) :
-    
-        self.central_thist.Scale(1., "width");
-        self.set_stat_unc_hists()
+        arrays, metadata = self.get_arrays()
+        arrays.pop("syst_raw_array", None)
+        arrays["sample_names"]=np.array(metadata["sample_names"], dtype=str)
+        arrays["input_sample_names"]=np.array(metadata["input_sample_names"], dtype=str)
+        return arrays
 
-    def normalize(self) :
-        
-        self.central_thist.Scale(1./self.central_thist.Integral())
-        self.set_stat_unc_hists()
+    def set_cache_arrays(self, cached_arrays):
 
-    def get_color(self) :
-        return self.color
-        
-    def set_label_name(self, name):
-        self.hist_label_name = name
+        self.sample_names=[str(sample_name) for sample_name in cached_arrays["sample_names"]]
+        self.input_sample_arrays=list(zip([str(sample_name) for sample_name in cached_arrays["input_sample_names"]],
+                                          cached_arrays["input_sample_contents"], cached_arrays["input_sample_sumw2"]))
+        self.set_bin_arrays(cached_arrays["bin_edges"], cached_arrays["bin_contents"], cached_arrays["bin_sumw2"])
+        self.axis_edges=get_axis_edges_from_arrays(cached_arrays)
+        self.fill_stats=cached_arrays["fill_stats"] if "fill_stats" in cached_arrays else None
 
-    def get_label_name(self):
-        return self.hist_label_name
-            
-    def print_input_sample_names(self):
-        for sample_name in self.sample_names:
-            print(sample_name)
+    @property
+    def central_thist(self):
 
-    def get_bin_edges(self):
+        if self.central_thist_cache is None:
+            self.central_thist_cache=make_hist_from_arrays(self.hist_name, self.bin_edges, self.bin_contents, self.bin_sumw2, self.axis_edges)
+            if self.fill_stats is not None:
+                self.central_thist_cache.PutStats(np.array(self.fill_stats))
+        return self.central_thist_cache
 
-        bin_edges = []
-        nbinsx=self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
-            bin_edges.append(self.central_thist.GetXaxis().GetBinLowEdge(ibin+1))
+    @central_thist.setter
+    def central_thist(self, thist):
 
-        # last bin upper edge
-        bin_edges.append(bin_edges[-1] + self.central_thist.GetBinWidth(nbinsx))
+        axis_edges=get_axis_edges(thist)
+        self.axis_edges=axis_edges if len(axis_edges) > 1 else None
+        self.set_bin_arrays(*get_hist_arrays(thist))
+        self.central_thist_cache=thist
 
-        return np.array(bin_edges)
+        # statistics of the fills, kept with the arrays so the mean does not depend on how this object was made
+        self.fill_stats=None
+        if axis_edges is not None and len(axis_edges) == 1:
+            stats=np.zeros(13) # TH1::kNstat
+            thist.GetStats(stats)
+            self.fill_stats=stats[:4]
 
-    def get_bin_centers(self):
+    @property
+    def input_thists(self):
+        # histogram of each input sample, made from input_sample_arrays when first used
 
-        bin_centers = []
-        nbinsx=self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
-            bin_centers.append(self.central_thist.GetXaxis().GetBinCenter(ibin+1))
+        if self.input_thists_cache is None:
+            self.input_thists_cache=[make_hist_from_arrays(sample_name, self.bin_edges, bin_contents, bin_sumw2, self.axis_edges)
+                                     for sample_name, bin_contents, bin_sumw2 in self.input_sample_arrays]
+        return self.input_thists_cache
 
-        return np.array(bin_centers)
+    @property
+    def stat_unc_hists(self):
 
-    def get_bin_contents(self):
-   
-        bin_contents = []
-        nbinsx=self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
-            bin_contents.append(self.central_thist.GetBinContent(ibin+1))
-    
-        return np.array(bin_contents)
-    
-    def get_bin_widths(self):
-   
-        bin_widths = []
-        nbinsx=self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
-            bin_widths.append(self.central_thist.GetXaxis().GetBinWidth(ibin+1))
+        if self.stat_unc_hists_cache is None:
+            self.set_stat_unc_hists()
+        return self.stat_unc_hists_cache
 
-        return np.array(bin_widths)
+    def set_input_sample_arrays(self, input_sample_arrays):
 
-    def set_stat_unc_hists(self):
-
-        if len(self.stat_unc_hists)!=0:
-            self.stat_unc_hists.clear()
-
-        self.stat_unc_hists.append(make_clean_hist(self.central_thist, "total_unc_up"))
-        self.stat_unc_hists.append(make_clean_hist(self.central_thist, "total_unc_down"))
+        super().set_input_sample_arrays(input_sample_arrays)
+        self.input_thists_cache = None
 
-        nbinsx=self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
+    def reset_derived(self):
+        # ROOT histograms are made again from the bin arrays when read
 
-            stat_up=self.central_thist.GetBinError(ibin+1)
+        super().reset_derived()
+        self.central_thist_cache = None
+        self.stat_unc_hists_cache = None
 
-            self.stat_unc_hists[up_down.up].SetBinContent(ibin+1, stat_up)
-            self.stat_unc_hists[up_down.down].SetBinContent(ibin+1, stat_up)
+    def release_derived(self):
+        # also the input sample histograms
 
-    def get_stat_errors(self, variation_direction=up_down.up):
+        super().release_derived()
+        self.input_thists_cache = None
 
-        bin_errors = []
-        nbinsx = self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
-            bin_errors.append(self.stat_unc_hists[variation_direction].GetBinContent(ibin+1))
+    def get_root_objects(self):
+        # ROOT histograms made so far
 
-        return np.array(bin_errors)
+        root_objects = [thist for thist in (self.central_thist_cache,) if thist is not None]
+        for root_hists in (self.stat_unc_hists_cache, self.input_thists_cache):
+            if root_hists is not None:
+                root_objects.extend(root_hists)
+        return root_objects
 
-    def __truediv__(self, other):
-        # operator overloading for ratio histogram with systematic info
-        # return new THxxDataWithSyst object
-        ratio_=copy.deepcopy(self)
-        ratio_.central_thist.Divide(other.central_thist)
+    def __getstate__(self):
+        # ROOT histograms are not pickled, they are made again from the bin arrays
 
-        ratio_.set_stat_unc_hists()
+        state = self.__dict__.copy()
+        state["central_thist_cache"] = None
+        state["stat_unc_hists_cache"] = None
+        state["input_thists_cache"] = None
+        return state
 
-        return ratio_
-
-    def __add__(self, other):
+    @timed("THxxData.set_stat_unc_hists")
+    def set_stat_unc_hists(self):
 
-        sum_=copy.deepcopy(self)
-        sum_.central_thist.Add(other.central_thist,1.)
+        self.stat_unc_hists_cache=[]
+        self.stat_unc_hists_cache.append(make_clean_hist(self.central_thist, "total_unc_up"))
+        self.stat_unc_hists_cache.append(make_clean_hist(self.central_thist, "total_unc_down"))
 
-        sum_.set_stat_unc_hists()
+        set_hist_contents(self.stat_unc_hists_cache[up_down.up], self.bin_errors)
+        set_hist_contents(self.stat_unc_hists_cache[up_down.down], self.bin_errors)
 
-        return sum_
-            
     def make_plot(self, show_syst=False, output_name="test.pdf"):
-        c1 = rt.TCanvas()
+        rt = import_root()
+        c1 = rt.TCanvas(get_root_name("c1"))
         
         self.central_thist.Draw()
         
@@ -179,6 +210,7 @@ class THxxData: # class RootHistData
         
         c1.Draw()
         c1.SaveAs(output_name)
+        close_canvas(c1)
         
     def get_central_data(self):
         pass 
@@ -1,158 +1,147 @@
-import ROOT as rt
 import numpy as np
 import math
 import THxxData
 import copy
 
 from helper import *
-
-from collections import defaultdict
+from HistogramCatalog import get_catalog
+from VariationStore import VariationStore
+from Profiler import timed
+from RootSession import get_root_name, close_canvas
 
 class THxxDataWithSyst(THxxData.THxxData):
-    #def __init__(self, *args, **kwargs):
     
-    def __init__(self, input_root_files, hist_name, hist_label_name, syst_input_root_files, syst_names, color='black'):
+    '''
+    syst_names: {syst_name: [postfix, ...]}, histograms are read as hist_name+syst_name+postfix
+    syst_rules: {syst_name: rule}, how the variations of a source are combined
+                "envelope" (default), "hessian", "replica_rms" or "symmetrized", see VariationStore
+    
+    cache: HistogramCache, see THxxData
     
-        super().__init__(input_root_files, hist_name, hist_label_name, color) # set central histogram
+    variations are kept as arrays in a VariationStore, use get_syst_raw_hist()
+    or get_syst_delta_hist() if a ROOT histogram of one variation is needed
+    '''
+    def __init__(self, input_root_files, hist_name, hist_label_name, syst_input_root_files, syst_names, color='black', n_workers=0, syst_rules=None, cache=None, unrolled_axes=None):
+    
+        super().__init__(input_root_files, hist_name, hist_label_name, color, n_workers=n_workers, cache=cache, unrolled_axes=unrolled_axes) # set central histogram
         
         self.syst_names = syst_names
-        self.syst_raw_hists_map=defaultdict(list)
-        
-        self.syst_hists_map=defaultdict(list) # delta
-        self.total_syst_hists=[] # total systematic uncertainty histograms
-        self.total_error_hists=[] # stat+syst histograms
+        self.variations=VariationStore(self.syst_names, len(self.get_bin_contents()), syst_rules)
         
-        # open root file
-        first_file=True
-        for root_file in syst_input_root_files:
-            #print(root_file)
-            temp_file=rt.TFile.Open(root_file, "READ")
+        # syst_input_root_files: list of root_file or HistogramCatalog
+        catalog, temporary_catalog = get_catalog(syst_input_root_files)
+
+        cache_key=None
+        if cache is not None:
+            cache_key=cache.make_key(catalog.input_root_files, [hist_name, self.variations.syst_names])
+        cached_arrays=None
+        if cache_key is not None:
+            cached_arrays=cache.load(cache_key)
+
+        if cached_arrays is not None:
+            self.variations.raw_array=cached_arrays["syst_raw_array"]
+        else:
+            self.read_syst_hists(catalog, n_workers)
+            if cache_key is not None:
+                cache.save(cache_key, {"syst_raw_array": self.variations.raw_array})
+
+        if temporary_catalog:
+            catalog.clear()
+        else:
+            catalog.release(self.hist_name, self.syst_names)
+
+        # total uncertainties are computed when first read
+        self.reset_total_errors()
+
+    @timed("THxxDataWithSyst.read_syst_hists")
+    def read_syst_hists(self, catalog, n_workers=0):
+
+        if n_workers > 1:
+            catalog.load(self.hist_name, self.syst_names, n_workers=n_workers)
+
+        for sample_name, root_file in catalog.input_root_files:
             
             # read systematic histograms
             for syst_name in self.syst_names :
                 for index, syst_postfix in enumerate(self.syst_names[syst_name]):
-                    temp_thist=temp_file.Get(hist_name+syst_name+syst_postfix)
-
                     # if systematic hist not exist read nominal one
-                    if type(temp_thist) != rt.TH1D :
-                        temp_thist=temp_file.Get(hist_name) 
-
-                    temp_thist.Sumw2()
-                    temp_thist.SetDirectory(0)
-                    if first_file:
-                        self.syst_raw_hists_map[syst_name].append(temp_thist)
-                    else:
-                        self.syst_raw_hists_map[syst_name][index].Add(temp_thist,1)
-            
-            first_file=False
-            temp_file.Close()
-        
-        # set total systematic histograms
-        self.set_total_syst_hists()
-        # set total uncertatiny histograms
-        self.set_total_error_hists()
-        
-    def get_total_errors(self, variation_direction=up_down.up):
-        
-        bin_errors = []
-        nbinsx = self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
-            bin_errors.append(self.total_error_hists[variation_direction].GetBinContent(ibin+1))
-        
-        return np.array(bin_errors)
+                    temp_thist=catalog.get_syst_hist(root_file, self.hist_name, syst_name, syst_postfix)
+                    self.variations.add_raw(syst_name, index, get_hist_arrays(temp_thist)[1])
+
+    @property
+    def total_syst_hists(self):
+        # total systematic uncertainty histograms
+
+        if self.total_syst_hists_cache is None:
+            self.set_total_syst_hists()
+        return self.total_syst_hists_cache
+
+    @property
+    def total_error_hists(self):
+        # stat+syst histograms
+
+        if self.total_error_hists_cache is None:
+            self.set_total_error_hists()
+        return self.total_error_hists_cache
+
+    def reset_total_errors(self):
+
+        super().reset_total_errors()
+        self.total_syst_hists_cache=None
+        self.total_error_hists_cache=None
+
+    def get_root_objects(self):
+
+        root_objects=super().get_root_objects()
+        for root_hists in (self.total_syst_hists_cache, self.total_error_hists_cache):
+            if root_hists is not None:
+                root_objects.extend(root_hists)
+        return root_objects
+
+    def __getstate__(self):
+
+        state=super().__getstate__()
+        state["total_syst_hists_cache"]=None
+        state["total_error_hists_cache"]=None
+        return state
+
+    def get_syst_raw_hist(self, syst_name, index):
+        # ROOT histogram of one variation, made on request
+
+        temp_thist=make_clean_hist(self.central_thist, self.hist_name+syst_name+self.variations.syst_names[syst_name][index])
+        set_hist_contents(temp_thist, self.variations.get_raw(syst_name, index))
+        return temp_thist
+
+    def get_syst_delta_hist(self, syst_name, index):
+
+        temp_thist=make_clean_hist(self.central_thist, syst_name+self.variations.syst_names[syst_name][index])
+        set_hist_contents(temp_thist, self.variations.get_raw(syst_name, index)-self.get_bin_contents())
+        return temp_thist
         
+    @timed("THxxDataWithSyst.set_total_syst_hists")
     def set_total_syst_hists(self):
-        
-        if len(self.total_syst_hists)!=0:
-            self.total_syst_hists.clear()
     
         # set squared delta sum up/down histograms
-        self.total_syst_hists.append(make_clean_hist(self.central_thist, "total_syst_up"))
-        self.total_syst_hists.append(make_clean_hist(self.central_thist, "total_syst_down"))
-        nbinsx=self.central_thist.GetNbinsX()
-        
-        # loop over systematic source
-        for syst_name in self.syst_names:
-            
-            syst_array=np.zeros((nbinsx, len(self.syst_names[syst_name])))
-            
-            # loop over variations
-            for index, syst_postfix in enumerate(self.syst_names[syst_name]):
-                temp_delta=self.syst_raw_hists_map[syst_name][index].Clone(syst_name+syst_postfix)
-                temp_delta.Add(self.central_thist,-1)
-                
-                self.syst_hists_map[syst_name].append(temp_delta)
-                
-                # set syst_array
-                for ibin in range(nbinsx):
-                    syst_array[ibin][index]=abs(temp_delta.GetBinContent(ibin+1))
-                
-            # set maximum variation for each bin
-            for ibin in range(nbinsx):
-                max_variation_ibin=np.amax(syst_array[ibin])
-                previous_tot_syst_up=self.total_syst_hists[up_down.up].GetBinContent(ibin+1)
-                previous_tot_syst_down=self.total_syst_hists[up_down.down].GetBinContent(ibin+1)
-                
-                update_tot_syst_up=previous_tot_syst_up*previous_tot_syst_up+max_variation_ibin*max_variation_ibin
-                update_tot_syst_down=previous_tot_syst_up*previous_tot_syst_down+max_variation_ibin*max_variation_ibin
-                
-                self.total_syst_hists[up_down.up].SetBinContent(ibin+1,math.sqrt(update_tot_syst_up))
-                self.total_syst_hists[up_down.down].SetBinContent(ibin+1,math.sqrt(update_tot_syst_down))
+        self.total_syst_hists_cache=[]
+        self.total_syst_hists_cache.append(make_clean_hist(self.central_thist, "total_syst_up"))
+        self.total_syst_hists_cache.append(make_clean_hist(self.central_thist, "total_syst_down"))
+        set_hist_contents(self.total_syst_hists_cache[up_down.up], self.get_total_syst_errors(up_down.up))
+        set_hist_contents(self.total_syst_hists_cache[up_down.down], self.get_total_syst_errors(up_down.down))
                 
+    @timed("THxxDataWithSyst.set_total_error_hists")
     def set_total_error_hists(self):
         # syst+stat
         
-        if len(self.total_error_hists)!=0:
-            self.total_error_hists.clear()
-        
-        self.total_error_hists.append(make_clean_hist(self.central_thist, "total_unc_up"))
-        self.total_error_hists.append(make_clean_hist(self.central_thist, "total_unc_down"))
-        
-        nbinsx=self.central_thist.GetNbinsX()
-        for ibin in range(nbinsx):
-            
-            tot_syst_up=self.total_syst_hists[up_down.up].GetBinContent(ibin+1)
-            stat_up=self.central_thist.GetBinError(ibin+1)
-           
-            tot_unc=tot_syst_up*tot_syst_up+stat_up*stat_up
-            #tot_unc=tot_syst_up*tot_syst_up
-            self.total_error_hists[up_down.up].SetBinContent(ibin+1,math.sqrt(tot_unc))
-            self.total_error_hists[up_down.down].SetBinContent(ibin+1,math.sqrt(tot_unc))
-            
-    def __add__(self, other):
-
-        sum_=copy.deepcopy(self)        
-        sum_.central_thist.Add(other.central_thist,1.)
-
-        for syst_name in self.syst_names :
-            for index, syst_postfix in enumerate(self.syst_names[syst_name]):
-                sum_.syst_raw_hists_map[syst_name][index].Add(other.syst_raw_hists_map[syst_name][index],1.) # TODO check how to handle if different systematics considered 
-
-        sum_.set_total_syst_hists()
-        sum_.set_total_error_hists()
+        self.total_error_hists_cache=[]
+        self.total_error_hists_cache.append(make_clean_hist(self.central_thist, "total_unc_up"))
+        self.total_error_hists_cache.append(make_clean_hist(self.central_thist, "total_unc_down"))
+        set_hist_contents(self.total_error_hists_cache[up_down.up], self.get_total_errors(up_down.up))
+        set_hist_contents(self.total_error_hists_cache[up_down.down], self.get_total_errors(up_down.down))
 
-        return sum_
-            
-    def __truediv__(self, other):
-        # operator overloading for ratio histogram with systematic info
-        # return new THxxDataWithSyst object
-        ratio_=copy.deepcopy(self)
-        ratio_.central_thist.Divide(other.central_thist)
-
-        ratio_.set_stat_unc_hists()
-        
-        for syst_name in self.syst_names :
-            for index, syst_postfix in enumerate(self.syst_names[syst_name]):
-                ratio_.syst_raw_hists_map[syst_name][index].Divide(other.central_thist)
-                
-        ratio_.set_total_syst_hists()
-        ratio_.set_total_error_hists()
-        
-        return ratio_
-        
     # test plot
     def make_plot(self,output_name="test_syst.pdf"):
-        c1 = rt.TCanvas()
+        rt = import_root()
+        c1 = rt.TCanvas(get_root_name("c1"))
         c1.SetLogx()
         print("make_plot in THxxDataWithSyst")
         
@@ -165,7 +154,8 @@ class THxxDataWithSyst(THxxData.THxxData):
         self.central_thist.SetMinimum(0.5)
         self.central_thist.SetMaximum(1.5)
         
-        total_syst_hist=self.central_thist.Clone("total_syst_hist")
+        total_syst_hist=self.central_thist.Clone(get_root_name("total_syst_hist"))
+        total_syst_hist.SetDirectory(0)
         for ibin in range(total_syst_hist.GetNbinsX()):
             total_syst_hist.SetBinError(ibin+1, self.total_syst_hists[up_down.up].GetBinContent(ibin+1))
         
@@ -181,7 +171,8 @@ class THxxDataWithSyst(THxxData.THxxData):
         self.central_thist.SetFillStyle(1001)
         self.central_thist.SetFillColorAlpha(rt.kBlack,0.5);
         
-        total_error_hist=self.central_thist.Clone("total_error_hist")
+        total_error_hist=self.central_thist.Clone(get_root_name("total_error_hist"))
+        total_error_hist.SetDirectory(0)
         for ibin in range(total_error_hist.GetNbinsX()):
             total_error_hist.SetBinError(ibin+1, self.total_error_hists[up_down.up].GetBinContent(ibin+1))
             
@@ -200,11 +191,12 @@ class THxxDataWithSyst(THxxData.THxxData):
         
         c1.Draw()
         c1.SaveAs(output_name)
+        close_canvas(c1)
 
 if __name__=='__main__':
 
     dy_hist=THxxDataWithSyst([("DY50plus","./hists.root")],"mm2016/2D_dipt_dimass_smeared","Drell-Yan",
-    ["./hists_syst.root"], {"_scale":["_up","_down"], "_IDSF":["_up","_down"]})
+    ["./hists_syst.root"], {"_scale":["_up","_down"], "_IDSF":["_up","_down"]}, syst_rules={"_IDSF":"symmetrized"})
     
     dy_hist.print_input_sample_names()
     dy_hist.make_plot()
@@ -0,0 +1,106 @@
+import numpy as np
+
+from helper import *
+from Profiler import timed
+
+class ToyGenerator:
+
+    '''
+    Statistical uncertainty of derived quantities from replicas of the histograms,
+    each histogram is drawn as a (toy, bin) array and the quantity is computed on all toys at once
+
+    method: "poisson" draws the contents as Poisson counts, for unweighted histograms
+            "bootstrap" draws weighted contents as a scaled Poisson with n_eff = contents^2/sumw2 entries
+    use_samples: draw each input sample and sum them, contents of samples with different weights fluctuate separately
+    seed: the same toys are drawn in every run, independent of chunk_size
+    chunk_size: number of toys drawn at once, memory of the draws grows with chunk_size*bins
+    interval: percent of the toys inside the band returned by the get_*_band() methods
+    '''
+    def __init__(self, n_toys=1000, method="bootstrap", use_samples=False, seed=0, chunk_size=500, interval=68.27):
+
+        if method not in ("poisson", "bootstrap"):
+            raise ValueError("Unknown toy method " + method)
+
+        self.n_toys=n_toys
+        self.method=method
+        self.use_samples=use_samples
+        self.seed=seed
+        self.chunk_size=chunk_size
+        self.interval=interval
+
+    def draw(self, bin_contents, bin_sumw2, rng, n_toys):
+
+        if self.method=="poisson":
+            return rng.poisson(np.maximum(bin_contents, 0.), size=(n_toys, len(bin_contents))).astype(np.float64)
+
+        # bins without positive contents and sumw2 do not fluctuate
+        fluctuates=(bin_contents > 0) & (bin_sumw2 > 0)
+        n_effective=np.where(fluctuates, divide_arrays(np.square(bin_contents), bin_sumw2), 0.)
+        scale=divide_arrays(bin_sumw2, bin_contents)
+        return np.where(fluctuates, rng.poisson(n_effective, size=(n_toys, len(bin_contents)))*scale, bin_contents)
+
+    def get_sources(self, hist):
+        # (bin_contents, bin_sumw2) drawn and summed for one histogram
+
+        if self.use_samples and hist.input_sample_arrays:
+            return [(contents, sumw2) for sample_name, contents, sumw2 in hist.input_sample_arrays]
+        return [(hist.get_bin_contents(), hist.bin_sumw2)]
+
+    @timed("ToyGenerator.evaluate")
+    def evaluate(self, function, *hists):
+        # function(*toys) with toys (toy, bin) of each histogram, called for every chunk of toys
+        # returns the results of all chunks joined along the first axis
+        # a histogram given more than once gets the same toys
+
+        # one random stream for each drawn array, so the toys do not depend on the chunk size
+        unique_hists={}
+        for index, hist in enumerate(hists):
+            if id(hist) not in unique_hists:
+                sources=self.get_sources(hist)
+                streams=[np.random.default_rng([self.seed, index, i_source]) for i_source in range(len(sources))]
+                unique_hists[id(hist)]=(sources, streams)
+
+        results=[]
+        for start in range(0, self.n_toys, self.chunk_size):
+            n_toys=min(self.chunk_size, self.n_toys-start)
+            toys={}
+            for hist_id, (sources, streams) in unique_hists.items():
+                toys[hist_id]=sum(self.draw(contents, sumw2, rng, n_toys) for (contents, sumw2), rng in zip(sources, streams))
+            results.append(function(*[toys[id(hist)] for hist in hists]))
+
+        return np.concatenate(results)
+
+    def get_band(self, values):
+        # (lower, median, upper) over the toys, toys giving nan are left out
+        return np.nanpercentile(values, [50.-self.interval/2., 50., 50.+self.interval/2.], axis=0)
+
+    def get_ratio_band(self, numerator, denominator):
+        # bins with a zero denominator toy are left out
+
+        def ratio(numerator_toys, denominator_toys):
+            ratio_toys=np.full(numerator_toys.shape, np.nan)
+            np.divide(numerator_toys, denominator_toys, out=ratio_toys, where=(denominator_toys!=0))
+            return ratio_toys
+
+        return self.get_band(self.evaluate(ratio, numerator, denominator))
+
+    def get_normalized_band(self, hist):
+        # band of the shape, every toy is normalized to its own integral
+
+        def normalize(toys):
+            return divide_arrays(toys, np.sum(toys, axis=-1, keepdims=True))
+
+        return self.get_band(self.evaluate(normalize, hist))
+
+    def get_mean_band(self, hist, x_start=0, x_end=0, slice_axis=1):
+        # band of the mean of the bins with centers in [x_start, x_end], one per slice of a 2D histogram
+        # see NumpyHistData.get_means()
+
+        bin_centers, in_range = hist.get_mean_range(x_start, x_end, slice_axis)
+
+        def mean(toys):
+            if hist.axis_edges is not None:
+                toys=hist.get_slice_array(toys, slice_axis)
+            return get_binned_means(bin_centers, toys[..., in_range])[0]
+
+        return self.get_band(self.evaluate(mean, hist))
@@ -0,0 +1,167 @@
+import numpy as np
+
+# rules to combine the deltas of one systematic source into one uncertainty
+# each takes deltas (variation, ...) with the variations of a source in contiguous rows,
+# the first row and number of rows of every source, and returns (source, ...)
+# add an entry to combination_rules to use a new rule
+
+def combine_envelope(delta_array, offsets, n_variations):
+    # maximum absolute delta
+    return np.maximum.reduceat(np.abs(delta_array), offsets, axis=0)
+
+def combine_hessian(delta_array, offsets, n_variations):
+    # quadrature sum of the deltas of eigenvector variations
+    return np.sqrt(np.add.reduceat(np.square(delta_array), offsets, axis=0))
+
+def combine_replica_rms(delta_array, offsets, n_variations):
+    # standard deviation of the replicas around their mean
+
+    counts = n_variations.reshape((-1,) + (1,) * (delta_array.ndim - 1))
+    replica_mean = np.add.reduceat(delta_array, offsets, axis=0) / counts
+    residual = delta_array - np.repeat(replica_mean, n_variations, axis=0)
+    return np.sqrt(np.add.reduceat(np.square(residual), offsets, axis=0) / np.maximum(counts - 1, 1))
+
+def combine_symmetrized(delta_array, offsets, n_variations):
+    # half of the difference between the first (up) and second (down) variation
+
+    down_index = np.where(n_variations > 1, offsets + 1, offsets)
+    down_delta = np.where((n_variations > 1).reshape((-1,) + (1,) * (delta_array.ndim - 1)), delta_array[down_index], 0.)
+    return np.abs(delta_array[offsets] - down_delta) / 2.
+
+combination_rules = {
+    "envelope": combine_envelope,
+    "hessian": combine_hessian,
+    "replica_rms": combine_replica_rms,
+    "symmetrized": combine_symmetrized,
+}
+
+# covariance of one source as a sum of outer products of factors, cov = factors.T @ factors
+# each takes the deltas (variation, bin) of one source and returns factors (factor, bin)
+# the diagonal of the covariance is the square of the combined uncertainty of the same rule
+
+def factors_envelope(source_deltas):
+    # approximation, one fully correlated component: the envelope with the sign of the first variation
+    sign = np.where(source_deltas[0] < 0, -1., 1.)
+    return (sign * np.max(np.abs(source_deltas), axis=0))[np.newaxis]
+
+def factors_hessian(source_deltas):
+    # every eigenvector variation is an independent component
+    return source_deltas
+
+def factors_replica_rms(source_deltas):
+
+    residual = source_deltas - np.mean(source_deltas, axis=0)
+    return residual / np.sqrt(max(len(source_deltas) - 1, 1))
+
+def factors_symmetrized(source_deltas):
+
+    if len(source_deltas) > 1:
+        return ((source_deltas[0] - source_deltas[1]) / 2.)[np.newaxis]
+    return source_deltas[:1] / 2.
+
+covariance_factors = {
+    "envelope": factors_envelope,
+    "hessian": factors_hessian,
+    "replica_rms": factors_replica_rms,
+    "symmetrized": factors_symmetrized,
+}
+
+class VariationStore:
+
+    '''
+    Raw contents of all systematic variations in one (variation, bin) array
+    rows of a source are contiguous, rows_of() gives the rows of one source
+    syst_names: {syst_name: [postfix, ...]}
+    syst_rules: {syst_name: rule in combination_rules}, "envelope" if not given
+    '''
+    def __init__(self, syst_names, n_bins, syst_rules=None):
+
+        if syst_rules is None:
+            syst_rules = {}
+
+        self.syst_names = {syst_name: list(syst_names[syst_name]) for syst_name in syst_names}
+        self.syst_rules = {syst_name: syst_rules.get(syst_name, "envelope") for syst_name in syst_names}
+        for syst_name, rule in self.syst_rules.items():
+            if rule not in combination_rules:
+                raise ValueError("Unknown combination rule " + rule + " for " + syst_name)
+
+        self.n_variations = np.array([len(self.syst_names[syst_name]) for syst_name in self.syst_names], dtype=int)
+        self.offsets = np.concatenate(([0], np.cumsum(self.n_variations)[:-1])).astype(int)
+        self.source_index = {syst_name: index for index, syst_name in enumerate(self.syst_names)}
+
+        self.raw_array = np.zeros((int(self.n_variations.sum()), n_bins))
+
+    def rows_of(self, syst_name):
+
+        index = self.source_index[syst_name]
+        return slice(self.offsets[index], self.offsets[index] + self.n_variations[index])
+
+    def get_raw(self, syst_name, index=None):
+
+        raw_array = self.raw_array[self.rows_of(syst_name)]
+        if index is None:
+            return raw_array
+        return raw_array[index]
+
+    def add_raw(self, syst_name, index, bin_contents):
+        self.raw_array[self.offsets[self.source_index[syst_name]] + index] += bin_contents
+
+    def with_raw_array(self, raw_array):
+        # same sources and rules sharing the layout, new raw contents
+
+        new_store = object.__new__(VariationStore)
+        new_store.__dict__.update(self.__dict__)
+        new_store.raw_array = raw_array
+        return new_store
+
+    def union(self, others):
+        # store with zero raw contents and the sources of self followed by the sources only found in others
+        # self is returned if others add no source, a source found twice must have the same number of variations
+
+        syst_names = dict(self.syst_names)
+        syst_rules = dict(self.syst_rules)
+        for other in others:
+            for syst_name in other.syst_names:
+                if syst_name not in syst_names:
+                    syst_names[syst_name] = other.syst_names[syst_name]
+                    syst_rules[syst_name] = other.syst_rules[syst_name]
+                elif len(syst_names[syst_name]) != len(other.syst_names[syst_name]):
+                    raise ValueError("Different number of variations of " + syst_name)
+
+        if len(syst_names) == len(self.syst_names):
+            return self
+        return VariationStore(syst_names, self.raw_array.shape[-1], syst_rules)
+
+    def get_delta_array(self, central_contents):
+        return self.raw_array - central_contents
+
+    def combine(self, delta_array):
+        # per source uncertainty (source, ...) from deltas (variation, ...)
+        # deltas can be of any derived quantity, not only bin contents
+
+        syst_error_array = np.zeros((len(self.n_variations),) + delta_array.shape[1:])
+        has_variations = self.n_variations > 0
+        if not has_variations.any():
+            return syst_error_array
+
+        offsets = self.offsets[has_variations]
+        n_variations = self.n_variations[has_variations]
+        rules = np.array([self.syst_rules[syst_name] for syst_name in self.syst_names])[has_variations]
+
+        combined_array = np.zeros((len(offsets),) + delta_array.shape[1:])
+        for rule in set(rules):
+            selected = rules == rule
+            combined_array[selected] = combination_rules[rule](delta_array, offsets, n_variations)[selected]
+        syst_error_array[has_variations] = combined_array
+
+        return syst_error_array
+
+    def get_factors(self, delta_array):
+        # {syst_name: factors (factor, bin)}, covariance of each source in low rank form, see covariance_factors
+
+        return {syst_name: covariance_factors[self.syst_rules[syst_name]](delta_array[self.rows_of(syst_name)])
+                for syst_name in self.syst_names if self.n_variations[self.source_index[syst_name]] > 0}
+
+    def get_total(self, central_contents):
+        # quadrature sum over sources
+        return np.sqrt(np.sum(np.square(self.combine(self.get_delta_array(central_contents))), axis=0))
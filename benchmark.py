@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import platform
+import itertools
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+from helper import *
+
+# benchmark of reading, systematics, arithmetic and drawing on synthetic ROOT files
+# python benchmark.py --n-bins 50 500 --n-samples 4 --output new.json
+# python benchmark.py --compare old.json new.json
+
+hist_name="bench/hist" # in a directory, as the histograms of real inputs
+
+def get_peak_rss():
+    # peak resident memory of this process in bytes
+
+    import resource
+    max_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform=="darwin" else max_rss*1024
+
+def get_revision():
+
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def make_inputs(work_dir, n_bins, n_samples, n_systs, n_variations, seed=0):
+    # one file per sample with the central histogram and every variation
+    # returns (input_root_files, syst_names)
+
+    rt = import_root()
+    rng = np.random.default_rng(seed)
+
+    bin_edges = np.geomspace(1., 1000., n_bins+1)
+    syst_names = {"_syst"+str(i_syst): ["_"+str(index) for index in range(n_variations)] for i_syst in range(n_systs)}
+
+    input_root_files = []
+    for i_sample in range(n_samples):
+        root_file = os.path.join(work_dir, "sample{}_{}bins_{}systs_{}variations.root".format(i_sample, n_bins, n_systs, n_variations))
+        bin_contents = rng.exponential(100., n_bins) + 1.
+        bin_sumw2 = bin_contents * rng.uniform(0.5, 1.5, n_bins)
+
+        temp_file = rt.TFile.Open(root_file, "RECREATE")
+        dir_name, base_name = hist_name.split("/")
+        temp_dir = temp_file.mkdir(dir_name)
+        temp_dir.WriteObject(make_hist_from_arrays(base_name, bin_edges, bin_contents, bin_sumw2), base_name)
+        for syst_name in syst_names:
+            for syst_postfix in syst_names[syst_name]:
+                name = base_name+syst_name+syst_postfix
+                temp_dir.WriteObject(make_hist_from_arrays(name, bin_edges, bin_contents*rng.normal(1., 0.05, n_bins), bin_sumw2), name)
+        temp_file.Close()
+
+        input_root_files.append(("sample"+str(i_sample), root_file))
+
+    return input_root_files, syst_names
+
+def measure(stage, function, n_items, n_repeat=5, setup=None):
+    # best and mean wall time over n_repeat calls, then one more call under tracemalloc for the peak
+    # setup() runs before each call outside the timing and its result is passed to function
+    # n_items: bins processed by one call, used for the throughput
+
+    times=[]
+    for i_repeat in range(n_repeat):
+        argument = setup() if setup is not None else None
+        start_time = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter()-start_time)
+
+    argument = setup() if setup is not None else None
+    tracemalloc.start()
+    function(argument)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "stage": stage,
+        "n_calls": n_repeat,
+        "time_min": min(times),
+        "time_mean": sum(times)/len(times),
+        "n_items": n_items,
+        "items_per_second": n_items/min(times) if min(times) > 0 else None,
+        "peak_python_bytes": peak_bytes,
+    }
+
+def run_config(work_dir, n_bins, n_samples, n_systs, n_variations, n_repeat=5):
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+    from THxxData import THxxData
+    from THxxDataWithSyst import THxxDataWithSyst
+    from MatplotlibDrawer import MatplotlibDrawer
+
+    input_root_files, syst_names = make_inputs(work_dir, n_bins, n_samples, n_systs, n_variations)
+    syst_root_files = [root_file for sample_name, root_file in input_root_files]
+    n_central_items = n_samples*n_bins
+    n_syst_items = n_samples*n_systs*n_variations*n_bins
+
+    def load_central(argument):
+        return THxxData(input_root_files, hist_name, "central", "red")
+
+    def load_syst(argument):
+        return THxxDataWithSyst(input_root_files, hist_name, "syst", syst_root_files, syst_names)
+
+    data = load_syst(None)
+    other = load_syst(None)
+
+    def set_total_syst_hists(argument):
+        data.reset_total_errors()
+        data.set_total_syst_hists()
+
+    def read_accessors(argument):
+        data.reset_total_errors()
+        data.get_bin_edges()
+        data.get_bin_centers()
+        data.get_bin_contents()
+        data.get_bin_widths()
+        data.get_stat_errors()
+        data.get_total_errors(up_down.up)
+        data.get_total_errors(up_down.down)
+
+    # total errors are computed when first read, they are included to compare with revisions computing them in the operators
+    def add(argument):
+        (data+other).get_total_errors()
+
+    def divide(argument):
+        (data/other).get_total_errors()
+
+    results = [
+        measure("THxxData.__init__", load_central, n_central_items, n_repeat),
+        measure("THxxDataWithSyst.__init__", load_syst, n_central_items+n_syst_items, n_repeat),
+        measure("set_total_syst_hists", set_total_syst_hists, n_systs*n_variations*n_bins, n_repeat),
+        measure("__add__", add, (n_systs*n_variations+1)*n_bins, n_repeat),
+        measure("__truediv__", divide, (n_systs*n_variations+1)*n_bins, n_repeat),
+        measure("accessors", read_accessors, n_bins, n_repeat),
+    ]
+
+    stack_data = [data]*n_samples
+    draw_calls = [
+        ("draw_hist", lambda drawer: drawer.draw_hist(data, 0, "red", label="hist"), n_bins),
+        ("draw_errorbar", lambda drawer: drawer.draw_errorbar(data, 0), n_bins),
+        ("draw_box_error", lambda drawer: drawer.draw_box_error(data, 0, error_name="total", label="total"), n_bins),
+        ("draw_hatch_error", lambda drawer: drawer.draw_hatch_error(data, 0), n_bins),
+        ("draw_stack", lambda drawer: drawer.draw_stack(*stack_data, i_row=0), n_samples*n_bins),
+    ]
+
+    drawers = []
+    def make_drawer():
+        drawer = MatplotlibDrawer(use_pyplot=False)
+        drawers.append(drawer)
+        return drawer
+
+    for stage, draw_call, n_items in draw_calls:
+        results.append(measure("MatplotlibDrawer."+stage, draw_call, n_items, n_repeat, setup=make_drawer))
+
+    def make_full_drawer():
+        drawer = make_drawer()
+        for stage, draw_call, n_items in draw_calls:
+            draw_call(drawer)
+        drawer.draw_labels(0)
+        return drawer
+
+    out_name = os.path.join(work_dir, "benchmark.pdf")
+    results.append(measure("MatplotlibDrawer.save_plot", lambda drawer: drawer.save_plot(out_name), n_samples*n_bins, n_repeat, setup=make_full_drawer))
+
+    for drawer in drawers:
+        drawer.close()
+
+    config = {"n_bins": n_bins, "n_samples": n_samples, "n_systs": n_systs, "n_variations": n_variations}
+    for result in results:
+        result.update(config)
+    return results
+
+def run_benchmark(n_bins_list, n_samples_list, n_systs_list, n_variations_list, n_repeat=5, work_dir=None):
+
+    import matplotlib
+
+    rt = import_root()
+
+    report = {
+        "revision": get_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "root": rt.gROOT.GetVersion(),
+        "machine": platform.machine(),
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        for n_bins, n_samples, n_systs, n_variations in itertools.product(n_bins_list, n_samples_list, n_systs_list, n_variations_list):
+            report["results"].extend(run_config(temp_dir, n_bins, n_samples, n_systs, n_variations, n_repeat))
+
+    report["peak_rss_bytes"] = get_peak_rss()
+    return report
+
+def get_result_key(result):
+    return (result["stage"], result["n_bins"], result["n_samples"], result["n_systs"], result["n_variations"])
+
+def print_report(report):
+
+    print("revision {} peak rss {:.1f} MB".format(report["revision"], report["peak_rss_bytes"]/1e6))
+    print("{:<34} {:>6} {:>7} {:>6} {:>10} {:>12} {:>14} {:>12}".format(
+          "stage", "bins", "samples", "systs", "variations", "time [ms]", "bins/s", "peak [MB]"))
+    for result in report["results"]:
+        print("{:<34} {:>6} {:>7} {:>6} {:>10} {:>12.3f} {:>14.3g} {:>12.2f}".format(
+              result["stage"], result["n_bins"], result["n_samples"], result["n_systs"], result["n_variations"],
+              result["time_min"]*1e3, result["items_per_second"] or 0., result["peak_python_bytes"]/1e6))
+
+def compare_reports(old_report, new_report):
+    # ratio new/old of the best time of every stage found in both reports
+
+    old_results = {get_result_key(result): result for result in old_report["results"]}
+    print("{} -> {}".format(old_report["revision"], new_report["revision"]))
+    print("{:<34} {:>6} {:>7} {:>6} {:>10} {:>12} {:>12} {:>8}".format(
+          "stage", "bins", "samples", "systs", "variations", "old [ms]", "new [ms]", "new/old"))
+    for result in new_report["results"]:
+        old_result = old_results.get(get_result_key(result))
+        if old_result is None:
+            continue
+        print("{:<34} {:>6} {:>7} {:>6} {:>10} {:>12.3f} {:>12.3f} {:>8.2f}".format(
+              result["stage"], result["n_bins"], result["n_samples"], result["n_systs"], result["n_variations"],
+              old_result["time_min"]*1e3, result["time_min"]*1e3, result["time_min"]/old_result["time_min"]))
+
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmark THxxData, THxxDataWithSyst and MatplotlibDrawer with synthetic inputs")
+    parser.add_argument("--n-bins", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--n-samples", type=int, nargs="+", default=[4])
+    parser.add_argument("--n-systs", type=int, nargs="+", default=[10])
+    parser.add_argument("--n-variations", type=int, nargs="+", default=[2])
+    parser.add_argument("--n-repeat", type=int, default=5)
+    parser.add_argument("--work-dir", default=None, help="directory for the synthetic ROOT files")
+    parser.add_argument("--output", default=None, help="JSON file to write the report to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two JSON reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            compare_reports(json.load(old_file), json.load(new_file))
+        sys.exit(0)
+
+    report = run_benchmark(args.n_bins, args.n_samples, args.n_systs, args.n_variations, args.n_repeat, args.work_dir)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as out_file:
+            json.dump(report, out_file, indent=1)
@@ -1,10 +1,285 @@
+import math
+import numpy as np
+
+from Profiler import timed
+from RootSession import get_root_name
+
+def import_root():
+    # ROOT takes seconds to import, modules import it only when a ROOT object is needed
+    import ROOT
+    return ROOT
 
 def make_clean_hist(original_hist, name):
 
-    new_hist = original_hist.Clone(name)
+    new_hist = original_hist.Clone(get_root_name(name))
+    new_hist.SetDirectory(0)
     new_hist.Reset()
     return new_hist
 
+def root_buffer_to_array(root_buffer, size):
+
+    # PyROOT returns C arrays as unsized views, set the size before reading
+    if hasattr(root_buffer, "reshape"):
+        root_buffer.reshape((size,))
+    elif hasattr(root_buffer, "SetSize"):
+        root_buffer.SetSize(size)
+    return np.frombuffer(root_buffer, dtype=np.float64, count=size).copy()
+
+def get_axis_bin_edges(taxis):
+
+    nbins = taxis.GetNbins()
+    if taxis.GetXbins().GetSize() > 0:
+        return root_buffer_to_array(taxis.GetXbins().GetArray(), nbins+1)
+    return np.linspace(taxis.GetXmin(), taxis.GetXmax(), nbins+1)
+
+def get_axis_edges(thist):
+    # bin edges of each axis, [x_edges] for 1D and [x_edges, y_edges] for 2D histograms
+
+    axis_edges = [get_axis_bin_edges(thist.GetXaxis())]
+    if thist.GetDimension() > 1:
+        axis_edges.append(get_axis_bin_edges(thist.GetYaxis()))
+    return axis_edges
+
+def get_unrolled_axis_edges(unrolled_axes):
+    # unrolled_axes: [x_edges, y_edges] or a TUnfoldBinning node with one distribution
+    # bins of an unrolled histogram are numbered with the first axis running fastest
+
+    if not hasattr(unrolled_axes, "GetDistributionBinning"):
+        return [np.asarray(edges, dtype=np.float64) for edges in unrolled_axes]
+
+    axis_edges = []
+    for axis in range(unrolled_axes.GetDistributionDimension()):
+        if unrolled_axes.HasUnderflow(axis) or unrolled_axes.HasOverflow(axis):
+            raise ValueError("TUnfoldBinning axes with underflow or overflow bins are not supported")
+        edges = unrolled_axes.GetDistributionBinning(axis)
+        axis_edges.append(np.array([edges[i] for i in range(edges.GetNrows())], dtype=np.float64))
+    return axis_edges
+
+def get_index_edges(n_bins):
+    # edges of bins numbered 0, 1, ..., used for flattened 2D contents
+    return np.arange(n_bins+1, dtype=np.float64)
+
+def get_visible_cells(thist, cells):
+    # visible bins of an array over all cells, 2D histograms are flattened with x running fastest
+
+    nbinsx = thist.GetNbinsX()
+    if thist.GetDimension() == 1:
+        return cells[1:nbinsx+1]
+    nbinsy = thist.GetNbinsY()
+    return cells.reshape((nbinsy+2, nbinsx+2))[1:nbinsy+1, 1:nbinsx+1].ravel()
+
+def get_cells(thist, visible_cells):
+    # inverse of get_visible_cells(), under/overflow cells are zero
+
+    nbinsx = thist.GetNbinsX()
+    cells = np.zeros(thist.GetNcells())
+    if thist.GetDimension() == 1:
+        cells[1:nbinsx+1] = visible_cells
+    else:
+        nbinsy = thist.GetNbinsY()
+        cells.reshape((nbinsy+2, nbinsx+2))[1:nbinsy+1, 1:nbinsx+1] = np.reshape(visible_cells, (nbinsy, nbinsx))
+    return cells
+
+def get_hist_arrays(thist):
+    # read bin edges, contents and sum of squared weights in bulk
+    # contents and sumw2 are for the visible bins only (no under/overflow)
+    # 2D histograms are flattened, bin_edges are then index edges, see get_axis_edges() for the axes
+
+    ncells = thist.GetNcells()
+    axis_edges = get_axis_edges(thist)
+
+    bin_contents = get_visible_cells(thist, root_buffer_to_array(thist.GetArray(), ncells))
+    if thist.GetSumw2N() > 0:
+        bin_sumw2 = get_visible_cells(thist, root_buffer_to_array(thist.GetSumw2().GetArray(), ncells))
+    else:
+        bin_sumw2 = np.abs(bin_contents)
+
+    if len(axis_edges) == 1:
+        bin_edges = axis_edges[0]
+    else:
+        bin_edges = get_index_edges(len(bin_contents))
+
+    return bin_edges, bin_contents, bin_sumw2
+
+def set_hist_contents(thist, bin_contents):
+    # fill visible bins from an array, under/overflow bins are set to zero
+    thist.SetContent(get_cells(thist, bin_contents))
+
+@timed("make_hist_from_arrays")
+def make_hist_from_arrays(name, bin_edges, bin_contents, bin_sumw2, axis_edges=None):
+    # 1D histogram from bin arrays, statistics are computed from the bin contents
+    # axis_edges: [x_edges, y_edges] to make a 2D histogram from flattened contents
+
+    rt = import_root()
+    name = get_root_name(name)
+
+    if axis_edges is not None and len(axis_edges) == 2:
+        x_edges, y_edges = [np.array(edges, dtype=np.float64) for edges in axis_edges]
+        thist = rt.TH2D(name, name, len(x_edges)-1, x_edges, len(y_edges)-1, y_edges)
+    else:
+        thist = rt.TH1D(name, name, len(bin_edges)-1, np.array(bin_edges, dtype=np.float64))
+    thist.SetDirectory(0)
+
+    set_hist_contents(thist, bin_contents)
+    sumw2 = get_cells(thist, bin_sumw2)
+    thist.GetSumw2().Set(len(sumw2), sumw2)
+    thist.ResetStats()
+
+    return thist
+
+def is_supported_hist(thist):
+    # TH1D and TH2D are read, anything else is treated as missing
+
+    rt = import_root()
+    return type(thist) in (rt.TH1D, rt.TH2D)
+
+def dump_hist(thist):
+    # all cells, statistics and binning of a 1D or 2D histogram as plain python/numpy objects
+    # used to send histograms between processes, see make_hist_from_dump()
+
+    nbinsx = thist.GetNbinsX()
+    ncells = thist.GetNcells()
+    xaxis = thist.GetXaxis()
+
+    stats = np.zeros(13) # TH1::kNstat, enough for any dimension
+    thist.GetStats(stats)
+
+    hist_dump = {
+        "name": thist.GetName(),
+        "title": thist.GetTitle(),
+        "dimension": thist.GetDimension(),
+        "nbinsx": nbinsx,
+        "xmin": xaxis.GetXmin(),
+        "xmax": xaxis.GetXmax(),
+        "bin_edges": None,
+        "axis_edges": None,
+        "contents": root_buffer_to_array(thist.GetArray(), ncells),
+        "sumw2": None,
+        "stats": stats,
+        "entries": thist.GetEntries(),
+    }
+    if hist_dump["dimension"] > 1:
+        # 2D histograms are made again with variable bin axes
+        hist_dump["axis_edges"] = get_axis_edges(thist)
+    elif xaxis.GetXbins().GetSize() > 0:
+        hist_dump["bin_edges"] = root_buffer_to_array(xaxis.GetXbins().GetArray(), nbinsx+1)
+    if thist.GetSumw2N() > 0:
+        hist_dump["sumw2"] = root_buffer_to_array(thist.GetSumw2().GetArray(), ncells)
+
+    return hist_dump
+
+def make_hist_from_dump(hist_dump):
+
+    rt = import_root()
+
+    if hist_dump["axis_edges"] is not None:
+        x_edges, y_edges = hist_dump["axis_edges"]
+        thist = rt.TH2D(hist_dump["name"], hist_dump["title"], len(x_edges)-1, x_edges, len(y_edges)-1, y_edges)
+    elif hist_dump["bin_edges"] is None:
+        thist = rt.TH1D(hist_dump["name"], hist_dump["title"], hist_dump["nbinsx"], hist_dump["xmin"], hist_dump["xmax"])
+    else:
+        thist = rt.TH1D(hist_dump["name"], hist_dump["title"], hist_dump["nbinsx"], hist_dump["bin_edges"])
+    thist.SetDirectory(0)
+
+    thist.SetContent(hist_dump["contents"])
+    if hist_dump["sumw2"] is not None:
+        thist.GetSumw2().Set(len(hist_dump["sumw2"]), hist_dump["sumw2"])
+    thist.PutStats(hist_dump["stats"])
+    thist.SetEntries(hist_dump["entries"])
+
+    return thist
+
+def divide_arrays(numerator, denominator):
+    # bin by bin division, zero where the denominator is zero as TH1::Divide
+
+    ratio = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=ratio, where=(denominator!=0))
+    return ratio
+
+def divide_sumw2(numerator, numerator_sumw2, denominator, denominator_sumw2):
+    # sum of squared weights of numerator/denominator for uncorrelated inputs as TH1::Divide
+
+    denominator_square = np.square(denominator)
+    sumw2 = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator_sumw2*denominator_square + denominator_sumw2*np.square(numerator), np.square(denominator_square),
+              out=sumw2, where=(denominator!=0))
+    return sumw2
+
+def get_binned_means(bin_centers, bin_contents, bin_sumw2=None):
+    # (mean, mean error) over the last axis for any number of histograms in the leading axes
+    # the error is computed as TH1::GetMeanError() after TH1::ResetStats(), None without bin_sumw2
+
+    sumw = np.sum(bin_contents, axis=-1)
+    mean = divide_arrays(np.sum(bin_contents*bin_centers, axis=-1), sumw)[()] # scalar for one histogram
+    if bin_sumw2 is None:
+        return mean, None
+
+    variance = np.maximum(divide_arrays(np.sum(bin_contents*np.square(bin_centers), axis=-1), sumw) - np.square(mean), 0.)
+    effective_entries = divide_arrays(np.square(sumw), np.sum(bin_sumw2, axis=-1))
+    return mean, np.sqrt(divide_arrays(variance, effective_entries))
+
+def get_stats_mean(stats):
+    # (mean, mean error) from the statistics of TH1::GetStats() as TH1::GetMean() and TH1::GetMeanError()
+    # stats: sumw, sumw2, sumwx, sumwx2 of the fills, sumw must not be zero
+
+    sumw, sumw2, sumwx, sumwx2 = stats[:4]
+    mean = sumwx/sumw
+    rms = math.sqrt(abs(sumwx2/sumw - mean*mean))
+    effective_entries = sumw*sumw/sumw2 if sumw2 > 0 else 0.
+    return mean, rms/math.sqrt(effective_entries) if effective_entries > 0 else 0.
+
+def get_chi2_probability(chi2, ndf):
+    # probability of a chi2 above the given one for ndf degrees of freedom, as TMath::Prob
+    # regularized upper incomplete gamma Q(ndf/2, chi2/2): series for small chi2, continued fraction otherwise
+
+    if ndf <= 0 or math.isnan(chi2):
+        return math.nan
+    if chi2 <= 0:
+        return 1.
+
+    a = ndf/2.
+    x = chi2/2.
+    prefactor = math.exp(a*math.log(x)-x-math.lgamma(a))
+
+    if x < a+1.:
+        term = total = 1./a
+        for i in range(1, 10000):
+            term *= x/(a+i)
+            total += term
+            if abs(term) < abs(total)*1e-15:
+                break
+        return max(0., 1.-prefactor*total)
+
+    tiny = 1e-300
+    b = x+1.-a
+    c = 1./tiny
+    d = 1./b
+    fraction = d
+    for i in range(1, 10000):
+        an = -i*(i-a)
+        b += 2.
+        d = an*d+b
+        d = 1./(d if abs(d) > tiny else tiny)
+        c = b+an/c
+        c = c if abs(c) > tiny else tiny
+        fraction *= d*c
+        if abs(d*c-1.) < 1e-15:
+            break
+    return prefactor*fraction
+
+def get_kolmogorov_probability(z):
+    # asymptotic probability of a KS distance above z/sqrt(n_entries), as TMath::KolmogorovProb
+
+    z = np.asarray(z, dtype=np.float64)
+    j = np.arange(1, 101).reshape((-1,)+(1,)*z.ndim)
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        # series converging fast for small and for large z
+        small = 1.-np.sqrt(2.*np.pi)/z*np.sum(np.exp(-np.square(2*j-1)*np.pi**2/(8.*np.square(z))), axis=0)
+        large = 2.*np.sum((-1.)**(j-1)*np.exp(-2.*np.square(j)*np.square(z)), axis=0)
+    probability = np.where(z < 1.18, small, large)
+    probability = np.where(z <= 0, 1., probability)
+    return np.clip(probability, 0., 1.)
+
 class up_down:
     up=0
     down=1